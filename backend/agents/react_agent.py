@@ -3,6 +3,7 @@ LangGraph ReAct agent for intelligent car search.
 Uses Claude for reasoning and tool execution.
 """
 from typing import Dict, Any, Optional, List
+import re
 
 from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
@@ -15,6 +16,10 @@ from core.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Keywords that mark a vague follow-up ("show me more", "anything else?").
+# Matched as substrings, without word boundaries.
+_FOLLOWUP_RE = re.compile("more|next|another|again|different|else")
+
 
 # =============================================================================
 # System Prompt
@@ -194,8 +199,7 @@ class CarSearchAgent:
         """Rewrite vague follow-up queries with context."""
         query_lower = query.lower().strip()
         
-        followup_keywords = ["more", "next", "another", "again", "different", "else"]
-        is_followup = any(kw in query_lower for kw in followup_keywords)
+        is_followup = _FOLLOWUP_RE.search(query_lower) is not None
         
         if not is_followup:
             return query
@@ -204,7 +208,7 @@ class CarSearchAgent:
         for msg in reversed(history):
             if isinstance(msg, HumanMessage):
                 content = msg.content.lower()
-                if not any(kw in content for kw in followup_keywords):
+                if not _FOLLOWUP_RE.search(content):
                     if "more" in query_lower:
                         return f"{msg.content} (page 2)"
                     return f"{msg.content} - {query}"
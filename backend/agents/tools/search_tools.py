@@ -5,10 +5,15 @@ Provides search, filtering, and persistence capabilities.
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 import asyncio
+import heapq
 
 from langchain_core.tools import tool
+from sqlalchemy import select
 
-from integrations.marketcheck_api import MarketCheckAPI
+from db.base import SessionLocal
+from db.models import Conversation, ConversationMessage, Search, SearchResult, Car
+from integrations.marketcheck_api import get_marketcheck_api
+from core.config import settings
 from core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -22,35 +27,19 @@ def filter_by_features(
     cars: List[Dict[str, Any]],
     required_features: List[str]
 ) -> List[Dict[str, Any]]:
-    """Filter cars by required features (color, type, etc.)."""
-    if not required_features:
+    """Filter normalized cars by required features (color, type, etc.)."""
+    if not cars or not required_features:
         return cars
     
-    def matches_features(car: Dict[str, Any]) -> bool:
-        car_features = [f.lower() for f in car.get("features", [])]
-        car_desc = (car.get("description") or "").lower()
-        car_color = (car.get("color") or "").lower()
-        
-        for req in required_features:
-            req_lower = req.lower()
-            if any(req_lower in f for f in car_features):
-                continue
-            if req_lower in car_desc:
-                continue
-            if req_lower in car_color:
-                continue
-            return False
-        return True
-    
-    filtered = [c for c in cars if matches_features(c)]
+    reqs_lower = [req.lower() for req in required_features]
+    filtered = [c for c in cars if all(r in c["_search_blob"] for r in reqs_lower)]
     logger.info("filtered_by_features", original=len(cars), filtered=len(filtered))
     return filtered
 
 
-def calculate_relevance_score(car: Dict[str, Any], query: str) -> int:
-    """Calculate relevance score for a car based on query."""
+def calculate_relevance_score(car: Dict[str, Any], query_lower: str) -> int:
+    """Calculate relevance score for a car based on an already-lowercased query."""
     score = 50  # Base score
-    query_lower = query.lower()
     
     # Brand match
     brand = (car.get("brand") or "").lower()
@@ -75,13 +64,21 @@ def calculate_relevance_score(car: Dict[str, Any], query: str) -> int:
 
 def rank_by_relevance(
     cars: List[Dict[str, Any]],
-    query: str
+    query: str,
+    limit: Optional[int] = None
 ) -> List[Dict[str, Any]]:
-    """Rank cars by relevance to user query."""
+    """Rank cars by relevance to user query, keeping only the top `limit` if given."""
+    if not cars or not query or not query.strip():
+        return cars
+    
+    query_lower = query.lower()  # Once per ranking, not once per car
     for car in cars:
-        car["match_score"] = calculate_relevance_score(car, query)
+        car["match_score"] = calculate_relevance_score(car, query_lower)
     
-    ranked = sorted(cars, key=lambda x: x.get("match_score", 0), reverse=True)
+    if limit is None:
+        ranked = sorted(cars, key=lambda x: x.get("match_score", 0), reverse=True)
+    else:
+        ranked = heapq.nlargest(limit, cars, key=lambda x: x.get("match_score", 0))
     
     if ranked:
         logger.info("ranked_results", top_score=ranked[0].get("match_score"))
@@ -91,6 +88,8 @@ def rank_by_relevance(
 
 def normalize_car_data(car: Dict[str, Any]) -> Dict[str, Any]:
     """Normalize car data to consistent format."""
+    description = (car.get("description") or "")[:200]
+    features = car.get("features", [])[:5]
     return {
         "brand": car.get("brand"),
         "model": car.get("model"),
@@ -99,15 +98,48 @@ def normalize_car_data(car: Dict[str, Any]) -> Dict[str, Any]:
         "mileage": car.get("mileage"),
         "location": car.get("location"),
         "dealer": car.get("dealer_name") or car.get("dealer"),
-        "description": (car.get("description") or "")[:200],
-        "features": car.get("features", [])[:5],
+        "description": description,
+        "features": features,
         "vin": car.get("vin") or "",
         "images": car.get("images", [])[:5],
         "source_url": car.get("sourceUrl") or car.get("source_url"),
-        "match_score": car.get("match_score", 50)
+        "match_score": car.get("match_score", 50),
+        # Lowercased once here so feature filtering is a plain substring check
+        "_search_blob": "\n".join([*features, description, car.get("color") or ""]).lower(),
     }
 
 
+async def fetch_listings(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Query every enabled listing source concurrently.
+    
+    Results are concatenated in source priority order. Each source is bounded
+    by source_timeout_seconds, so a stalled or failing source contributes
+    nothing instead of holding up the search.
+    """
+    sources = [api for api in (get_marketcheck_api(),) if api.enabled]
+    if not sources:
+        return []
+    
+    results = await asyncio.gather(
+        *(
+            asyncio.wait_for(api.search_listings(params), timeout=settings.source_timeout_seconds)
+            for api in sources
+        ),
+        return_exceptions=True
+    )
+    
+    listings = []
+    for api, result in zip(sources, results):
+        source = type(api).__name__
+        if isinstance(result, BaseException):
+            logger.warning("listing_source_failed", source=source, error=str(result) or type(result).__name__)
+            continue
+        logger.info("listing_source_results", source=source, count=len(result))
+        listings.extend(result)
+    return listings
+
+
 # =============================================================================
 # LangChain Tools
 # =============================================================================
@@ -193,49 +225,42 @@ async def search_car_listings(
     if fuel_type:
         params["fuel_type"] = fuel_type
     
-    # Execute search - Using MarketCheck as primary source (better results)
-    raw_cars = []
+    # Execute search across all sources, then deduplicate and normalize
+    # in a single pass over the combined results
+    cars = []
     existing_vins = set()  # Track by VIN for deduplication
     existing_keys = set()  # Track by brand+model+year+price for cars without VIN
     
-    # Primary: MarketCheck API (better and richer results)
-    marketcheck_api = MarketCheckAPI()
-    if marketcheck_api.enabled:
-        try:
-            marketcheck_results = await marketcheck_api.search_listings(params)
-            for car in marketcheck_results:
-                vin = car.get("vin", "")
-                key = f"{car.get('brand')}_{car.get('model')}_{car.get('year')}_{car.get('price')}"
-                
-                # Deduplicate by VIN or key
-                if vin:
-                    if vin not in existing_vins:
-                        existing_vins.add(vin)
-                        raw_cars.append(car)
-                elif key not in existing_keys:
-                    existing_keys.add(key)
-                    raw_cars.append(car)
-            
-            logger.info("marketcheck_results", count=len(marketcheck_results), added=len(raw_cars))
-        except Exception as e:
-            logger.warning("marketcheck_error", error=str(e))
-    
-    
-    logger.info("total_api_results", count=len(raw_cars))
+    for car in await fetch_listings(params):
+        vin = car.get("vin", "")
+        
+        # Deduplicate by VIN or key
+        if vin:
+            if vin in existing_vins:
+                continue
+            existing_vins.add(vin)
+        else:
+            key = (car.get("brand"), car.get("model"), car.get("year"), car.get("price"))
+            if key in existing_keys:
+                continue
+            existing_keys.add(key)
+        
+        cars.append(normalize_car_data(car))
     
-    # Normalize data
-    cars = [normalize_car_data(car) for car in raw_cars]
+    logger.info("total_api_results", count=len(cars))
     
     # Apply feature filtering
     if required_features:
         cars = filter_by_features(cars, required_features)
     
     # Rank by relevance
-    if user_query:
-        cars = rank_by_relevance(cars, user_query)
+    if user_query and user_query.strip():
+        cars = rank_by_relevance(cars, user_query, limit)
     
     # Return requested limit
     result = cars[:limit]
+    for car in result:
+        car.pop("_search_blob", None)
     
     logger.info("tool_search_complete", returned=len(result))
     return result
@@ -260,12 +285,10 @@ def save_search_results(
     Returns:
         Dict with search_id, cars_saved, success status
     """
-    from db.base import SessionLocal
-    from db.models import Conversation, ConversationMessage, Search, SearchResult, Car
-    
     logger.info("tool_save_start", user_id=user_id, results_count=len(results))
     
     db = SessionLocal()
+    now = datetime.utcnow()
     try:
         # Get or create conversation
         conversation = db.query(Conversation).filter(
@@ -276,22 +299,25 @@ def save_search_results(
             conversation = Conversation(
                 user_id=user_id,
                 title="Car Search",
-                created_at=datetime.utcnow()
+                created_at=now
             )
             db.add(conversation)
             db.flush()
         
         # Check for duplicate message
-        last_msg = db.query(ConversationMessage).filter(
-            ConversationMessage.conversation_id == conversation.id
-        ).order_by(ConversationMessage.created_at.desc()).first()
+        last_msg = db.execute(
+            select(ConversationMessage.role, ConversationMessage.content)
+            .where(ConversationMessage.conversation_id == conversation.id)
+            .order_by(ConversationMessage.created_at.desc(), ConversationMessage.id.desc())
+            .limit(1)
+        ).first()
         
         if not (last_msg and last_msg.role == "user" and query.lower() in last_msg.content.lower()):
             db.add(ConversationMessage(
                 conversation_id=conversation.id,
                 role="user",
                 content=query,
-                created_at=datetime.utcnow()
+                created_at=now
             ))
         
         # Add assistant response
@@ -299,20 +325,19 @@ def save_search_results(
             conversation_id=conversation.id,
             role="assistant",
             content=summary,
-            created_at=datetime.utcnow()
+            created_at=now
         ))
         
         # Create search record
         search = Search(
             user_id=user_id,
             query=query,
-            created_at=datetime.utcnow()
+            created_at=now
         )
         db.add(search)
-        db.flush()
         
-        # Save cars
-        saved_count = 0
+        # Build cars, then flush them together with the search in one round trip
+        pending = []
         for i, car_data in enumerate(results):
             try:
                 match_score = car_data.get("match_score", 50)
@@ -331,23 +356,28 @@ def save_search_results(
                         "images": car_data.get("images", [])[:3],
                     },
                     active=True,
-                    created_at=datetime.utcnow()
+                    created_at=now
                 )
-                db.add(car)
-                db.flush()
-                
-                db.add(SearchResult(
-                    search_id=search.id,
-                    car_id=car.id,
-                    rank=i + 1,
-                    match_score=match_score
-                ))
-                saved_count += 1
+                pending.append((i + 1, match_score, car))
                 
             except Exception as e:
                 logger.warning("car_save_failed", error=str(e))
                 continue
         
+        db.add_all([car for _, _, car in pending])
+        db.flush()
+        
+        db.add_all([
+            SearchResult(
+                search_id=search.id,
+                car_id=car.id,
+                rank=rank,
+                match_score=match_score
+            )
+            for rank, match_score, car in pending
+        ])
+        saved_count = len(pending)
+        
         db.commit()
         
         logger.info(
@@ -383,12 +413,10 @@ def send_message_to_user(user_id: int, message: str) -> Dict[str, Any]:
     Returns:
         Dict with message_id and success status
     """
-    from db.base import SessionLocal
-    from db.models import Conversation, ConversationMessage
-    
     logger.info("tool_message_start", user_id=user_id)
     
     db = SessionLocal()
+    now = datetime.utcnow()
     try:
         conversation = db.query(Conversation).filter(
             Conversation.user_id == user_id
@@ -398,7 +426,7 @@ def send_message_to_user(user_id: int, message: str) -> Dict[str, Any]:
             conversation = Conversation(
                 user_id=user_id,
                 title="Car Search",
-                created_at=datetime.utcnow()
+                created_at=now
             )
             db.add(conversation)
             db.flush()
@@ -407,7 +435,7 @@ def send_message_to_user(user_id: int, message: str) -> Dict[str, Any]:
             conversation_id=conversation.id,
             role="assistant",
             content=message,
-            created_at=datetime.utcnow()
+            created_at=now
         )
         db.add(msg)
         db.commit()
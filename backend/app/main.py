@@ -1,6 +1,7 @@
 """
 Main FastAPI application with routes and middleware.
 """
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -15,6 +16,8 @@ from core.config import settings
 from core.logging import configure_logging, get_logger
 from core.exceptions import AppException
 from db.base import init_db
+from integrations.anthropic_client import get_claude_client
+from integrations.marketcheck_api import close_http_client, warm_up_http_client
 from modules.auth.router import router as auth_router
 from modules.search.router import router as search_router
 from modules.billing.router import router as billing_router
@@ -30,7 +33,20 @@ async def lifespan(app: FastAPI):
     logger.info("application_startup")
     init_db()
     logger.info("database_initialized")
+    
+    # Pre-warm TLS connections to external APIs so the first search doesn't
+    # pay the handshakes; bounded so an outage can't hold up boot
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(get_claude_client().warm_up(), warm_up_http_client()),
+            timeout=3.0
+        )
+        logger.info("connections_warmed")
+    except asyncio.TimeoutError:
+        logger.warning("connection_warm_up_timeout")
+    
     yield
+    await close_http_client()
     logger.info("application_shutdown")
 
 
@@ -43,12 +59,7 @@ app = FastAPI(
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://localhost:3000",
-        "https://search-auto.vercel.app",
-        "https://search-auto-*.vercel.app",  # Preview deployments
-    ],
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
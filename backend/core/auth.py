@@ -33,7 +33,7 @@ async def get_current_user(
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid user ID")
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
@@ -50,6 +50,6 @@ async def get_optional_user(
     
     try:
         user_id = int(x_user_id)
-        return db.query(User).filter(User.id == user_id).first()
+        return db.get(User, user_id)
     except (ValueError, TypeError):
         return None
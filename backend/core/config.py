@@ -2,6 +2,8 @@
 Application configuration using Pydantic Settings.
 Follows 12-factor app principles with environment-based configuration.
 """
+from types import SimpleNamespace
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -19,6 +21,16 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = Field(..., alias="DATABASE_URL")
+    db_pool_size: int = Field(default=10, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=20, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout_seconds: int = 5
+    db_pool_recycle_seconds: int = 1800
+    
+    # Cache (dogpile.cache; in-process memory unless REDIS_URL is set)
+    redis_url: str = Field(default="", alias="REDIS_URL")
+    cache_expiration_seconds: int = 300
+    # In-process cache of converted MarketCheck listings per API request
+    marketcheck_cache_ttl_seconds: int = 300
     
     # AI Configuration (Claude)
     anthropic_api_key: str = Field(default="", alias="ANTHROPIC_API_KEY")
@@ -28,6 +40,25 @@ class Settings(BaseSettings):
     openai_api_key: str = Field(default="", alias="OPENAI_API_KEY")
     openai_embedding_model: str = "text-embedding-3-small"
     
+    # Semantic cache for feature extraction (needs OPENAI_API_KEY)
+    # Cosine similarity for text-embedding-3-small, which scores short car
+    # queries close together; 0.92 (a MiniLM-era value) let different
+    # searches collide
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_ttl_seconds: int = 3600
+    # Budget for the embedding round trip; on timeout the lookup is a miss
+    semantic_cache_embed_timeout_seconds: float = 0.5
+    
+    # CORS (exact-match origins; Starlette does not expand wildcards here)
+    cors_origins: list[str] = Field(
+        default=[
+            "http://localhost:5173",
+            "http://localhost:3000",
+            "https://search-auto.vercel.app",
+        ],
+        alias="CORS_ORIGINS",
+    )
+    
     # Security
     secret_key: str = Field(..., alias="SECRET_KEY")
     jwt_algorithm: str = "HS256"
@@ -38,6 +69,9 @@ class Settings(BaseSettings):
     default_search_limit: int = 10
     search_timeout_seconds: int = 60
     api_request_timeout_seconds: int = 30
+    source_timeout_seconds: int = 15  # Per listing source during fan-out
+    http_max_connections: int = Field(default=100, alias="HTTP_MAX_CONNECTIONS")
+    http_max_keepalive_connections: int = Field(default=20, alias="HTTP_MAX_KEEPALIVE_CONNECTIONS")
     
     # Data Sources
     marketcheck_api_key: str = Field(default="", alias="MARKETCHECK_API_KEY")
@@ -54,5 +88,6 @@ class Settings(BaseSettings):
     )
 
 
-# Singleton instance
-settings = Settings()
+# Singleton instance. Validated once at import, then flattened to a plain
+# namespace so per-request reads are simple attribute lookups.
+settings = SimpleNamespace(**Settings().model_dump())
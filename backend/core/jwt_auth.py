@@ -3,13 +3,20 @@ JWT-based authentication for production security.
 Replaces the insecure x-user-id header approach.
 """
 import os
-from datetime import datetime, timedelta
+import threading
+import time
 from typing import Optional
 try:
     import jwt
+    _ExpiredTokenError = jwt.ExpiredSignatureError
+    _InvalidTokenError = jwt.InvalidTokenError
 except ImportError:
     from jose import jwt
-from fastapi import Depends, HTTPException, Header
+    _ExpiredTokenError = jwt.ExpiredSignatureError
+    _InvalidTokenError = jwt.JWTError
+from cachetools import TTLCache
+from fastapi import Depends, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from db.base import get_db
@@ -32,21 +39,33 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Built once rather than per encode/decode call
+_ALGORITHMS = [ALGORITHM]
+_SECRET_KEY_BYTES = SECRET_KEY.encode()
+
+# Verified token cache: clients reuse the same bearer token for days, so
+# decode each one once and serve repeats from memory. Only successful
+# decodes are cached, and `exp` is re-checked on every hit.
+TOKEN_CACHE_MAX_SIZE = 10_000
+TOKEN_CACHE_TTL_SECONDS = 300
+_token_cache: TTLCache = TTLCache(maxsize=TOKEN_CACHE_MAX_SIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = threading.Lock()
+
 
 def create_access_token(user_id: int, email: str) -> str:
     """
     Create a JWT access token for a user.
     Token expires in 7 days.
     """
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    now = int(time.time())
     payload = {
         "user_id": user_id,
         "email": email,
-        "exp": expire,
-        "iat": datetime.utcnow()
+        "exp": now + ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "iat": now
     }
     
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    token = jwt.encode(payload, _SECRET_KEY_BYTES, algorithm=ALGORITHM)
     logger.info("access_token_created", user_id=user_id)
     return token
 
@@ -56,25 +75,34 @@ def verify_token(token: str) -> dict:
     Verify and decode a JWT token.
     Raises HTTPException if invalid or expired.
     """
+    with _token_cache_lock:
+        cached = _token_cache.get(token)
+    if cached is not None:
+        if cached.get("exp", 0) > time.time():
+            return cached
+        with _token_cache_lock:
+            _token_cache.pop(token, None)
+        raise HTTPException(status_code=401, detail="Token has expired")
+    
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, _SECRET_KEY_BYTES, algorithms=_ALGORITHMS)
+        if "exp" in payload:
+            with _token_cache_lock:
+                _token_cache[token] = payload
         return payload
-    except Exception as e:
-        # Handle both PyJWT and python-jose exceptions
-        error_msg = str(e).lower()
-        if "expired" in error_msg:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        else:
-            raise HTTPException(status_code=401, detail="Invalid token")
+    except _ExpiredTokenError:
+        raise HTTPException(status_code=401, detail="Token has expired")
+    except _InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
 
 
-async def get_current_user_jwt(
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
-) -> User:
+async def _verified_claims(authorization: Optional[str] = Header(None)) -> dict:
     """
-    Get current user from JWT token in Authorization header.
+    Parse the Authorization header and verify the JWT, without touching the DB.
     Expects: "Bearer <token>"
+    
+    Declared ahead of get_db in get_current_user_jwt so a bad or missing
+    token is rejected before a pooled connection is borrowed.
     """
     if not authorization:
         raise HTTPException(
@@ -90,24 +118,40 @@ async def get_current_user_jwt(
             detail="Invalid authorization header format. Expected: Bearer <token>"
         )
     
-    token = parts[1]
-    
     # Verify and decode token
-    payload = verify_token(token)
-    user_id = payload.get("user_id")
-    
-    if not user_id:
+    payload = verify_token(parts[1])
+    if not payload.get("user_id"):
         raise HTTPException(status_code=401, detail="Invalid token payload")
     
-    # Get user from database
-    user = db.query(User).filter(User.id == user_id).first()
+    return payload
+
+
+async def get_current_user_jwt(
+    request: Request,
+    claims: dict = Depends(_verified_claims),
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Get current user from the verified JWT claims.
+    
+    The user is memoized on request.state, so further resolutions within
+    the same request skip the DB fetch.
+    """
+    cached_user = getattr(request.state, "user", None)
+    if cached_user is not None:
+        return cached_user
+    
+    # Get user from database (off the event loop; the session is synchronous)
+    user = await run_in_threadpool(db.get, User, claims["user_id"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
+    request.state.user = user
     return user
 
 
 async def get_optional_user_jwt(
+    request: Request,
     authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ) -> Optional[User]:
@@ -116,6 +160,7 @@ async def get_optional_user_jwt(
         return None
     
     try:
-        return await get_current_user_jwt(authorization, db)
+        claims = await _verified_claims(authorization)
+        return await get_current_user_jwt(request, claims, db)
     except HTTPException:
         return None
@@ -2,19 +2,33 @@
 SQLAlchemy base configuration and session management.
 """
 from typing import Generator
-from sqlalchemy import create_engine
+from dogpile.cache import make_region
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
 from core.config import settings
 
+# TCP keepalives let the driver notice dead connections, so checkouts
+# don't need a pre-ping round trip; pool_recycle retires old connections.
+_connect_args = {}
+if settings.database_url.startswith("postgresql"):
+    _connect_args = {
+        "keepalives": 1,
+        "keepalives_idle": 30,
+        "keepalives_interval": 10,
+        "keepalives_count": 3,
+    }
+
 # Create engine
 engine = create_engine(
     settings.database_url,
     echo=settings.app_env == "development",
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout_seconds,
+    pool_recycle=settings.db_pool_recycle_seconds,
+    connect_args=_connect_args,
 )
 
 # Session factory
@@ -27,6 +41,21 @@ SessionLocal = sessionmaker(
 # Declarative base for models
 Base = declarative_base()
 
+# Second-level cache for hot read-mostly lookups. Values are pickled, so any
+# cached ORM instances are detached snapshots that must be merged into the
+# caller's session before use.
+if settings.redis_url:
+    cache_region = make_region().configure(
+        "dogpile.cache.redis",
+        expiration_time=settings.cache_expiration_seconds,
+        arguments={"url": settings.redis_url},
+    )
+else:
+    cache_region = make_region().configure(
+        "dogpile.cache.memory_pickle",
+        expiration_time=settings.cache_expiration_seconds,
+    )
+
 
 def get_db() -> Generator[Session, None, None]:
     """
@@ -40,6 +69,31 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+def sync_server_defaults() -> None:
+    """
+    Apply model server defaults to existing tables.
+    create_all only sets column defaults when it creates a table.
+    
+    Each ALTER takes an ACCESS EXCLUSIVE lock, so this is a one-off
+    migration step run from db.init_db, never at app startup.
+    """
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for column in table.columns:
+                if column.server_default is None:
+                    continue
+                default = column.server_default.arg
+                if isinstance(default, str):
+                    default_sql = f"'{default}'"
+                else:
+                    default_sql = default.compile(
+                        dialect=engine.dialect, compile_kwargs={"literal_binds": True}
+                    )
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" SET DEFAULT {default_sql}'
+                ))
+
+
 def init_db() -> None:
     """Initialize database (create tables if they don't exist)."""
     try:
@@ -2,15 +2,47 @@
 Database initialization script.
 Creates tables and enables pgvector extension.
 """
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
-from db.base import engine, Base
-from db.models import User, Car, Search, SearchResult, UserPreference
+from db.base import engine, Base, sync_server_defaults
+from db.models import User, Car, Search, SearchResult, UserPreference, ConversationMessage
 from core.logging import get_logger
 
 logger = get_logger(__name__)
 
 
+def create_missing_indexes() -> None:
+    """
+    Create model-declared indexes on tables that already existed.
+    create_all only emits indexes together with a new table.
+    """
+    for model in (Search, SearchResult, ConversationMessage):
+        for index in model.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+    logger.info("database_indexes_ensured")
+
+
+def create_vector_indexes(conn) -> None:
+    """
+    Create the HNSW index used by CarRepository.find_similar.
+    Skipped when cars has no embedding column (pgvector not in use).
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("cars")}
+    if "embedding" not in columns:
+        logger.info("car_embedding_index_skipped", reason="no embedding column")
+        return
+    
+    # Index a half-precision projection of the embedding; find_similar
+    # queries the same expression so the planner can use it.
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS cars_embedding_halfvec_hnsw ON cars "
+        "USING hnsw ((embedding::halfvec(1536)) halfvec_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64)"
+    ))
+    conn.commit()
+    logger.info("car_embedding_index_ready")
+
+
 def init_database():
     """Initialize database tables and extensions."""
     logger.info("database_init_start")
@@ -27,6 +59,16 @@ def init_database():
     Base.metadata.create_all(bind=engine)
     logger.info("database_tables_created")
     
+    sync_server_defaults()
+    create_missing_indexes()
+    
+    with engine.connect() as conn:
+        try:
+            create_vector_indexes(conn)
+        except Exception as exc:
+            conn.rollback()
+            logger.warning("car_embedding_index_failed", error=str(exc))
+    
     logger.info("database_init_complete")
 
 
@@ -2,12 +2,18 @@
 SQLAlchemy database models.
 """
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text, JSON, ForeignKey, Index, func
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 
 from .base import Base
 
+# Naive UTC timestamp computed by Postgres, matching the datetime.utcnow values.
+# Timestamp columns keep the Python default too: the server default only exists
+# on tables created by create_all or migrated by db.init_db, and older tables
+# would otherwise get NULL timestamps.
+UTC_NOW = func.timezone("utc", func.now())
+
 
 class User(Base):
     __tablename__ = "users"
@@ -19,7 +25,7 @@ class User(Base):
     location = Column(String)
     postal_code = Column(String)
     initial_preferences = Column(JSON)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
     
     # Stripe integration
     stripe_customer_id = Column(String, unique=True)
@@ -45,7 +51,7 @@ class Plan(Base):
     stripe_price_id = Column(String, unique=True)
     active = Column(Boolean, default=True)
     features = Column(JSON)  # Store plan features as JSON
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
 
 
 class UserSubscription(Base):
@@ -61,12 +67,12 @@ class UserSubscription(Base):
     current_period_start = Column(DateTime)
     current_period_end = Column(DateTime)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW, onupdate=datetime.utcnow)
     
-    # Relationships
+    # Relationships (plan is always read alongside the subscription)
     user = relationship("User", back_populates="subscription")
-    plan = relationship("Plan")
+    plan = relationship("Plan", lazy="joined")
 
 
 class Car(Base):
@@ -75,7 +81,7 @@ class Car(Base):
     id = Column(Integer, primary_key=True)
     car_data = Column(JSON, nullable=False)
     active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
 
 
 class Search(Base):
@@ -87,7 +93,12 @@ class Search(Base):
     query = Column(Text, nullable=False)
     extracted_features = Column(JSON)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
+    
+    __table_args__ = (
+        # User history / latest search: WHERE user_id = ? ORDER BY created_at DESC
+        Index("ix_searches_user_created", user_id, created_at.desc()),
+    )
     
     # Relationships
     user = relationship("User", back_populates="searches")
@@ -104,11 +115,25 @@ class SearchResult(Base):
     match_score = Column(Float)
     rank = Column(Integer)
     
+    __table_args__ = (
+        # Results of a search: WHERE search_id = ? ORDER BY rank
+        Index("ix_search_results_search_rank", search_id, rank),
+    )
+    
     # Relationships
     search = relationship("Search", back_populates="results")
     car = relationship("Car")
 
 
+class SearchSummary(Base):
+    """AI summary of a search, generated once and served on later fetches."""
+    __tablename__ = "search_summaries"
+    
+    search_id = Column(Integer, ForeignKey("searches.id"), primary_key=True)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
+
+
 class UserPreference(Base):
     __tablename__ = "user_preferences"
     
@@ -121,7 +146,7 @@ class UserPreference(Base):
     price_range_min = Column(Integer)
     price_range_max = Column(Integer)
     
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW, onupdate=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="preferences")
@@ -133,11 +158,11 @@ class Conversation(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
     title = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
+    updated_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="conversations")
-    messages = relationship("ConversationMessage", back_populates="conversation", cascade="all, delete-orphan", order_by="ConversationMessage.created_at")
+    messages = relationship("ConversationMessage", back_populates="conversation", cascade="all, delete-orphan", order_by="[ConversationMessage.created_at, ConversationMessage.id]")
 
 
 class ConversationMessage(Base):
@@ -147,6 +172,21 @@ class ConversationMessage(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'assistant'
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
+    
+    __table_args__ = (
+        # Latest messages: WHERE conversation_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_conversation_messages_conv_created", conversation_id, created_at.desc(), id.desc()),
+    )
     
     conversation = relationship("Conversation", back_populates="messages")
+
+
+class FeatureBatch(Base):
+    """Message Batch submitted through the feature-batch API, for ownership checks."""
+    __tablename__ = "feature_batches"
+    
+    id = Column(String, primary_key=True)  # Anthropic batch ID
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    query_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, server_default=UTC_NOW)
@@ -4,19 +4,39 @@ Separates database operations from business logic.
 """
 from typing import List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import Float, cast, desc, insert, literal, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.types import UserDefinedType
 
+from .base import cache_region
 from .models import (
     User,
     Car,
     Search,
     SearchResult,
+    SearchSummary,
     UserPreference,
     Conversation,
     ConversationMessage,
+    FeatureBatch,
 )
 from core.exceptions import NotFoundException
 
+# Embeddings are compared as halfvec (fp16): half the index size and memory
+# bandwidth of full-precision vectors, with negligible recall loss.
+EMBEDDING_DIMENSIONS = 1536
+
+
+class _HalfVec(UserDefinedType):
+    """pgvector halfvec type, used only as a CAST target."""
+    cache_ok = True
+    
+    def get_col_spec(self, **kw) -> str:
+        return f"halfvec({EMBEDDING_DIMENSIONS})"
+
+
+_HALFVEC_EMBEDDING = cast(literal_column("cars.embedding"), _HalfVec())
+
 
 class UserRepository:
     """Repository for User operations."""
@@ -34,23 +54,60 @@ class UserRepository:
         )
         self.db.add(user)
         self.db.commit()
-        self.db.refresh(user)
         return user
     
     def get_by_id(self, user_id: int) -> User:
         """Get user by ID."""
-        user = self.db.query(User).filter(User.id == user_id).first()
+        user = self.db.get(User, user_id)
         if not user:
             raise NotFoundException("User", user_id)
         return user
     
     def get_by_username(self, username: str) -> Optional[User]:
         """Get user by username."""
-        return self.db.query(User).filter(User.username == username).first()
+        user_id = self._id_by_username(username)
+        if user_id is None:
+            return None
+        user = self.db.get(User, user_id)
+        if user is None or user.username != username:
+            # Stale cache entry: renamed or deleted by another process
+            self._id_by_username.invalidate(self, username)
+            return self.db.query(User).filter(User.username == username).first()
+        return user
     
     def get_by_email(self, email: str) -> Optional[User]:
         """Get user by email."""
-        return self.db.query(User).filter(User.email == email).first()
+        user_id = self._id_by_email(email)
+        if user_id is None:
+            return None
+        user = self.db.get(User, user_id)
+        if user is None or user.email != email:
+            # Stale cache entry: email changed or user deleted by another process
+            self._id_by_email.invalidate(self, email)
+            return self.db.query(User).filter(User.email == email).first()
+        return user
+    
+    # Only the username/email -> id mapping is cached. The User row itself is
+    # always loaded through the current session, so credits and passwords are
+    # never served stale. Misses are not cached, so signups are seen at once.
+    @cache_region.cache_on_arguments(should_cache_fn=lambda user_id: user_id is not None)
+    def _id_by_username(self, username: str) -> Optional[int]:
+        return self.db.query(User.id).filter(User.username == username).scalar()
+    
+    @cache_region.cache_on_arguments(should_cache_fn=lambda user_id: user_id is not None)
+    def _id_by_email(self, email: str) -> Optional[int]:
+        return self.db.query(User.id).filter(User.email == email).scalar()
+    
+    def invalidate_cached_lookups(
+        self,
+        username: Optional[str] = None,
+        email: Optional[str] = None
+    ) -> None:
+        """Drop cached username/email lookups after they change."""
+        if username:
+            self._id_by_username.invalidate(self, username)
+        if email:
+            self._id_by_email.invalidate(self, email)
     
     def update_preferences(
         self,
@@ -81,6 +138,7 @@ class UserRepository:
     ) -> User:
         """Update basic user profile fields."""
         user = self.get_by_id(user_id)
+        self.invalidate_cached_lookups(username=user.username, email=user.email)
         if username is not None:
             user.username = username
         if email is not None:
@@ -97,6 +155,9 @@ class UserRepository:
 class CarRepository:
     """Repository for Car operations."""
     
+    # HNSW candidate list size for similarity queries (recall vs. latency)
+    HNSW_EF_SEARCH = 40
+    
     def __init__(self, db: Session):
         self.db = db
     
@@ -105,46 +166,58 @@ class CarRepository:
         car = Car(**car_data)
         self.db.add(car)
         self.db.commit()
-        self.db.refresh(car)
         return car
     
     def bulk_create(self, cars_data: List[dict]) -> List[Car]:
-        """Create multiple car listings."""
-        cars = [Car(**data) for data in cars_data]
-        self.db.bulk_save_objects(cars, return_defaults=True)
+        """Create multiple car listings in a single multi-row INSERT."""
+        if not cars_data:
+            return []
+        cars = self.db.scalars(insert(Car).returning(Car), cars_data).all()
         self.db.commit()
         return cars
     
     def get_by_id(self, car_id: int) -> Car:
         """Get car by ID."""
-        car = self.db.query(Car).filter(Car.id == car_id).first()
+        car = self.db.get(Car, car_id)
         if not car:
             raise NotFoundException("Car", car_id)
         return car
     
     def find_similar(self, embedding: List[float], limit: int = 10) -> List[tuple[Car, float]]:
-        """Find cars similar to the given embedding using cosine similarity."""
+        """
+        Find cars similar to the given embedding using cosine similarity.
+        Compares in half precision to match the cars_embedding_halfvec_hnsw index.
+        """
+        self.db.execute(text(f"SET LOCAL hnsw.ef_search = {self.HNSW_EF_SEARCH}"))
+        query_vector = "[" + ",".join(str(float(x)) for x in embedding) + "]"
+        distance = _HALFVEC_EMBEDDING.op("<=>", return_type=Float)(
+            cast(literal(query_vector), _HalfVec())
+        )
         results = self.db.query(
             Car,
-            Car.embedding.cosine_distance(embedding).label("distance")
+            distance.label("distance")
         ).filter(
             Car.active == True,
-            Car.embedding.isnot(None)
+            literal_column("cars.embedding").isnot(None)
         ).order_by(
-            "distance"
+            distance
         ).limit(limit).all()
         
         return [(car, 1 - distance) for car, distance in results]
     
     def get_active_cars(self, limit: int = 100) -> List[Car]:
-        """Get all active cars."""
+        """Get all active cars (cached for a short window)."""
+        return [self.db.merge(car, load=False) for car in self._active_cars_snapshot(limit)]
+    
+    @cache_region.cache_on_arguments(expiration_time=30)
+    def _active_cars_snapshot(self, limit: int) -> List[Car]:
         return self.db.query(Car).filter(Car.active == True).limit(limit).all()
     
     def get_by_location(self, location: str, limit: int = 10) -> List[Car]:
         """Get cars by location."""
         return self.db.query(Car).filter(
             Car.active == True,
-            Car.location.ilike(f"%{location}%")
+            Car.car_data["location"].as_string().ilike(f"%{location}%")
         ).limit(limit).all()
 
 
@@ -163,16 +236,32 @@ class SearchRepository:
         )
         self.db.add(search)
         self.db.commit()
-        self.db.refresh(search)
         return search
     
     def get_by_id(self, search_id: int) -> Search:
         """Get search by ID."""
-        search = self.db.query(Search).filter(Search.id == search_id).first()
+        search = self.db.get(Search, search_id)
         if not search:
             raise NotFoundException("Search", search_id)
         return search
     
+    def get_summary(self, search_id: int) -> Optional[str]:
+        """Get the stored summary for a search, if one was generated."""
+        summary = self.db.get(SearchSummary, search_id)
+        return summary.content if summary else None
+    
+    def add_summary(self, search_id: int, content: str) -> bool:
+        """
+        Store a search's summary unless one already exists.
+        Does not commit. Returns False if another request stored it first.
+        """
+        inserted = self.db.execute(
+            pg_insert(SearchSummary)
+            .values(search_id=search_id, content=content)
+            .on_conflict_do_nothing(index_elements=[SearchSummary.search_id])
+        )
+        return inserted.rowcount == 1
+    
     def get_user_history(self, user_id: int, limit: int = 20) -> List[Search]:
         """Get user's search history."""
         return self.db.query(Search).filter(
@@ -182,26 +271,29 @@ class SearchRepository:
         ).limit(limit).all()
     
     def get_latest_with_results(self, user_id: int) -> Optional[tuple[Search, List[tuple[Car, float]]]]:
-        """Get user's most recent search with its car results."""
-        # Get the most recent search
-        latest_search = self.db.query(Search).filter(
+        """Get user's most recent search with its car results (single query)."""
+        latest_search_id = select(Search.id).where(
             Search.user_id == user_id
         ).order_by(
             desc(Search.created_at)
-        ).first()
+        ).limit(1).scalar_subquery()
         
-        if not latest_search:
-            return None
-        
-        # Get the search results with cars
-        results = self.db.query(Car, SearchResult.match_score).join(
-            SearchResult, Car.id == SearchResult.car_id
+        # Outer joins keep the search row even when it has no results
+        rows = self.db.query(Search, Car, SearchResult.match_score).outerjoin(
+            SearchResult, SearchResult.search_id == Search.id
+        ).outerjoin(
+            Car, Car.id == SearchResult.car_id
         ).filter(
-            SearchResult.search_id == latest_search.id
+            Search.id == latest_search_id
         ).order_by(
             SearchResult.rank
         ).all()
         
+        if not rows:
+            return None
+        
+        latest_search = rows[0][0]
+        results = [(car, match_score) for _, car, match_score in rows if car is not None]
         return (latest_search, results)
 
 
@@ -221,13 +313,13 @@ class SearchResultRepository:
         )
         self.db.add(result)
         self.db.commit()
-        self.db.refresh(result)
         return result
     
     def bulk_create(self, results_data: List[dict]) -> List[SearchResult]:
-        """Create multiple search results."""
-        results = [SearchResult(**data) for data in results_data]
-        self.db.bulk_save_objects(results, return_defaults=True)
+        """Create multiple search results in a single multi-row INSERT."""
+        if not results_data:
+            return []
+        results = self.db.scalars(insert(SearchResult).returning(SearchResult), results_data).all()
         self.db.commit()
         return results
     
@@ -260,7 +352,6 @@ class UserPreferenceRepository:
             self.db.add(preference)
         
         self.db.commit()
-        self.db.refresh(preference)
         return preference
     
     def get_by_user(self, user_id: int) -> Optional[UserPreference]:
@@ -282,10 +373,17 @@ class ConversationRepository:
         if conversation:
             return conversation
         
-        conversation = Conversation(user_id=user_id, title="Car Buying Assistant")
-        self.db.add(conversation)
+        # Single round trip, and safe against a concurrent create for the same user
+        conversation = self.db.scalars(
+            pg_insert(Conversation)
+            .values(user_id=user_id, title="Car Buying Assistant")
+            .on_conflict_do_nothing(index_elements=[Conversation.user_id])
+            .returning(Conversation)
+        ).first()
         self.db.commit()
-        self.db.refresh(conversation)
+        if conversation is None:
+            # Another request created it first
+            conversation = self.db.query(Conversation).filter(Conversation.user_id == user_id).one()
         return conversation
     
     def list_messages(self, conversation_id: int, limit: int = 50) -> List[ConversationMessage]:
@@ -293,12 +391,13 @@ class ConversationRepository:
         messages = (
             self.db.query(ConversationMessage)
             .filter(ConversationMessage.conversation_id == conversation_id)
-            .order_by(ConversationMessage.created_at.desc())
+            .order_by(ConversationMessage.created_at.desc(), ConversationMessage.id.desc())
             .limit(limit)
             .all()
         )
-        # Return in chronological order
-        return sorted(messages, key=lambda m: m.created_at)
+        # Rows arrive newest-first in a total order, so reversing is chronological
+        messages.reverse()
+        return messages
     
     def add_message(self, conversation_id: int, role: str, content: str) -> ConversationMessage:
         """Persist a conversation message."""
@@ -309,5 +408,25 @@ class ConversationRepository:
         )
         self.db.add(message)
         self.db.commit()
-        self.db.refresh(message)
         return message
+
+
+class FeatureBatchRepository:
+    """Repository for FeatureBatch operations."""
+    
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def create(self, batch_id: str, user_id: int, query_count: int) -> FeatureBatch:
+        """Record a submitted batch against the user who submitted it."""
+        batch = FeatureBatch(id=batch_id, user_id=user_id, query_count=query_count)
+        self.db.add(batch)
+        self.db.commit()
+        return batch
+    
+    def get_for_user(self, batch_id: str, user_id: int) -> FeatureBatch:
+        """Get a batch by ID, treating other users' batches as not found."""
+        batch = self.db.get(FeatureBatch, batch_id)
+        if not batch or batch.user_id != user_id:
+            raise NotFoundException("Feature batch", batch_id)
+        return batch
@@ -2,31 +2,115 @@
 Anthropic Claude client for AI-powered car search operations.
 Provides feature extraction and summary generation.
 """
-from typing import List, Dict, Any, Optional
-import json
+from functools import lru_cache
+from typing import AsyncIterator, List, Dict, Any, Optional
+import asyncio
+import copy
+import hashlib
+import zlib
 
 from anthropic import AsyncAnthropic
-from tenacity import retry, stop_after_attempt, wait_exponential
+from cachetools import TTLCache
 
 from core.config import settings
 from core.logging import get_logger
 from core.exceptions import ExternalServiceException
+from integrations.semantic_cache import semantic_cache
 
 logger = get_logger(__name__)
 
+# Static system prompts are kept byte-identical across calls so Anthropic's
+# prompt cache can serve them on repeat requests.
+FEATURE_EXTRACTION_PROMPT = """Extract car search parameters from the query by calling emit_features.
+Only include fields the query actually specifies.
+
+Rules:
+- "Range Rover" → brand: "Land Rover", model: "Range Rover"
+- "electric car" or "EV" → fuel_type: "Electric"
+- "hybrid" → fuel_type: "Hybrid"
+- Colors go in features array: ["red", "leather seats"]
+- "under $30k" → price_max: 30000"""
+
+# Forced tool call: Claude returns the features as a typed object instead of
+# free text, so there is no JSON to clean up or fail to parse.
+FEATURE_EXTRACTION_TOOL = {
+    "name": "emit_features",
+    "description": "Record the car search parameters extracted from the user's query.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "brand": {"type": "string", "description": "Manufacturer name"},
+            "model": {"type": "string", "description": "Model name"},
+            "type": {
+                "type": "string",
+                "enum": ["SUV", "Sedan", "Truck", "Coupe", "Convertible", "Van", "Wagon"],
+            },
+            "fuel_type": {"type": "string", "enum": ["Electric", "Hybrid", "Diesel", "Gasoline"]},
+            "year_min": {"type": "integer"},
+            "year_max": {"type": "integer"},
+            "price_min": {"type": "number"},
+            "price_max": {"type": "number"},
+            "features": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "Colors and features like AWD, sunroof, leather",
+            },
+            "location": {"type": "string"},
+        },
+    },
+}
+
+SEARCH_SUMMARY_PROMPT = """Generate a brief, friendly summary of car search results.
+Keep it to 2-3 sentences. Highlight the top car. Be conversational and helpful."""
+
+# Small result sets for a query that named the brand get a templated summary
+# instead of a Claude call. Phrasing is picked by a stable hash of the query.
+TEMPLATE_SUMMARY_MAX_RESULTS = 3
+_SUMMARY_TEMPLATES = (
+    "Found {count} {cars} for you. Top pick: {car}{price}.",
+    "Here {are} {count} {cars} matching your search. The best match is the {car}{price}.",
+    "I found {count} {cars}. Start with the {car}{price} - it's the strongest match.",
+)
+
+
+def _system_blocks(system_prompt: str) -> List[Dict[str, Any]]:
+    """Wrap a system prompt as a prompt-cacheable content block."""
+    return [{
+        "type": "text",
+        "text": system_prompt,
+        "cache_control": {"type": "ephemeral"},
+    }]
+
+
+def _tool_input(content: List[Any]) -> Dict[str, Any]:
+    """Return the input of the first tool_use block, or {} if there is none."""
+    for block in content:
+        if block.type == "tool_use":
+            return dict(block.input)
+    return {}
+
 
 class ClaudeClient:
     """Async client for Claude API operations."""
     
     def __init__(self):
-        self._client = AsyncAnthropic(api_key=settings.anthropic_api_key)
+        # The SDK retries connection errors, 408/409/429 and 5xx with backoff;
+        # one retry matches the previous policy without an extra wrapper
+        self._client = AsyncAnthropic(api_key=settings.anthropic_api_key, max_retries=1)
         self._model = settings.anthropic_model
+        # Exact-query feature cache; users often re-run or page through the
+        # same query text while changing UI filters
+        self._features_cache: TTLCache = TTLCache(maxsize=1024, ttl=600)
+    
+    async def warm_up(self) -> None:
+        """Open a connection to the Anthropic API with a cheap models call."""
+        if not settings.anthropic_api_key:
+            return
+        try:
+            await self._client.models.list(limit=1)
+        except Exception as e:
+            logger.warning("claude_warm_up_failed", error=str(e))
     
-    @retry(
-        stop=stop_after_attempt(2),
-        wait=wait_exponential(multiplier=1, min=1, max=5),
-        reraise=True
-    )
     async def complete(
         self,
         messages: List[Dict[str, str]],
@@ -55,88 +139,253 @@ class ClaudeClient:
             response = await self._client.messages.create(
                 model=self._model,
                 max_tokens=max_tokens,
-                system=system_prompt or "You are a helpful assistant.",
+                system=_system_blocks(system_prompt or "You are a helpful assistant."),
                 messages=formatted
             )
             
             content = response.content[0].text if response.content else ""
             
-            logger.info(
-                "claude_completion_success",
-                input_tokens=response.usage.input_tokens,
-                output_tokens=response.usage.output_tokens
-            )
+            self._log_usage("claude_completion_success", response)
             return content
             
         except Exception as e:
             logger.error("claude_completion_error", error=str(e))
             raise ExternalServiceException("Claude", str(e))
     
-    async def extract_search_features(self, query: str) -> Dict[str, Any]:
+    async def complete_with_tool(
+        self,
+        messages: List[Dict[str, str]],
+        tool: Dict[str, Any],
+        system_prompt: str,
+        max_tokens: int = 256,
+    ) -> Dict[str, Any]:
+        """
+        Force Claude to answer by calling a single tool.
+        
+        Args:
+            messages: Conversation messages
+            tool: Tool definition with name, description and input_schema
+            system_prompt: System instructions
+            max_tokens: Max response tokens
+        
+        Returns:
+            The tool call input, or {} if Claude did not call the tool
+        """
+        try:
+            response = await self._client.messages.create(
+                model=self._model,
+                max_tokens=max_tokens,
+                system=_system_blocks(system_prompt),
+                tools=[tool],
+                tool_choice={"type": "tool", "name": tool["name"]},
+                messages=messages
+            )
+            
+            self._log_usage("claude_tool_call_success", response)
+            return _tool_input(response.content)
+            
+        except Exception as e:
+            logger.error("claude_tool_call_error", tool=tool["name"], error=str(e))
+            raise ExternalServiceException("Claude", str(e))
+    
+    @staticmethod
+    def _log_usage(event: str, response: Any) -> None:
+        """Log token usage, including prompt-cache reads and writes."""
+        logger.info(
+            event,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            cache_read_tokens=getattr(response.usage, "cache_read_input_tokens", None),
+            cache_write_tokens=getattr(response.usage, "cache_creation_input_tokens", None)
+        )
+    
+    async def extract_search_features(self, query: str, namespace: Optional[str] = None) -> Dict[str, Any]:
         """
         Extract structured car features from natural language query.
         
         Args:
             query: User's search query
+            namespace: Semantic cache partition (e.g. user ID); None skips the cache
         
         Returns:
             Dict with brand, model, price_max, features, etc.
         """
-        system_prompt = """Extract car search parameters from the query.
-Return ONLY valid JSON with these optional fields:
-- brand: string (manufacturer name)
-- model: string (model name)
-- type: string (SUV, Sedan, Truck, Coupe, Convertible, Van, Wagon)
-- fuel_type: string (Electric, Hybrid, Diesel, Gasoline)
-- year_min: number
-- year_max: number
-- price_min: number
-- price_max: number
-- features: array of strings (colors, features like AWD, sunroof, leather)
-- location: string
-
-Rules:
-- "Range Rover" → brand: "Land Rover", model: "Range Rover"
-- "electric car" or "EV" → fuel_type: "Electric"
-- "hybrid" → fuel_type: "Hybrid"
-- Colors go in features array: ["red", "leather seats"]
-- "under $30k" → price_max: 30000
-- Return ONLY JSON, no explanation"""
-
+        # Both caches hold private copies and hand out fresh ones, so callers
+        # may modify the returned features without touching cached entries.
+        cache_key = hashlib.blake2b(" ".join(query.lower().split()).encode(), digest_size=16).digest()
+        cached = self._features_cache.get(cache_key)
+        if cached is not None:
+            logger.info("features_cache_hit", query=query[:50])
+            return copy.deepcopy(cached)
+        
+        if namespace is None:
+            features = await self._extract_features(query)
+            if features:
+                self._features_cache[cache_key] = copy.deepcopy(features)
+            return features
+        
+        # The semantic lookup (an embedding round trip) races the Claude call
+        # instead of delaying it; a hit that lands first cancels the call.
+        lookup = asyncio.create_task(semantic_cache.lookup(query, namespace))
+        extraction = asyncio.create_task(self._extract_features(query))
+        done, _ = await asyncio.wait({lookup, extraction}, return_when=asyncio.FIRST_COMPLETED)
+        
+        if lookup in done:
+            cached, embedding = lookup.result()
+            if cached is not None:
+                extraction.cancel()
+                return copy.deepcopy(cached)
+            features = await extraction
+            if features and embedding is not None:
+                semantic_cache.store(query, embedding, namespace, copy.deepcopy(features))
+        else:
+            features = extraction.result()
+            if features:
+                snapshot = copy.deepcopy(features)
+                
+                # Store once the embedding arrives, without waiting for it
+                def store_when_embedded(task: asyncio.Task) -> None:
+                    if task.cancelled() or task.exception() is not None:
+                        return
+                    _, embedding = task.result()
+                    if embedding is not None:
+                        semantic_cache.store(query, embedding, namespace, snapshot)
+                
+                lookup.add_done_callback(store_when_embedded)
+        
+        if features:
+            self._features_cache[cache_key] = copy.deepcopy(features)
+        return features
+    
+    async def _extract_features(self, query: str) -> Dict[str, Any]:
+        """Call Claude to extract features; empty dict on failure."""
         messages = [{"role": "user", "content": f"Extract from: {query}"}]
         
-        response = await self.complete(messages, system_prompt=system_prompt, max_tokens=256)
+        features = await self.complete_with_tool(
+            messages,
+            FEATURE_EXTRACTION_TOOL,
+            system_prompt=FEATURE_EXTRACTION_PROMPT,
+            max_tokens=256
+        )
+        
+        if not features:
+            logger.warning("feature_extraction_failed", query=query[:50])
+            return {}
+        
+        logger.info("features_extracted", query=query[:50], features=features)
+        return features
+    
+    async def submit_feature_batch(self, queries: List[str]) -> str:
+        """
+        Submit feature extraction for many queries as one Message Batch.
+        
+        Batches are billed at half the synchronous rate and are meant for
+        background re-processing, not interactive searches.
+        
+        Args:
+            queries: Search queries to extract features from
+        
+        Returns:
+            Batch ID to poll with get_feature_batch_results
+        """
+        requests = [
+            {
+                "custom_id": f"q{i}",
+                "params": {
+                    "model": self._model,
+                    "max_tokens": 256,
+                    "system": _system_blocks(FEATURE_EXTRACTION_PROMPT),
+                    "tools": [FEATURE_EXTRACTION_TOOL],
+                    "tool_choice": {"type": "tool", "name": FEATURE_EXTRACTION_TOOL["name"]},
+                    "messages": [{"role": "user", "content": f"Extract from: {query}"}],
+                },
+            }
+            for i, query in enumerate(queries)
+        ]
         
         try:
-            # Clean markdown formatting if present
-            cleaned = response.strip()
-            if cleaned.startswith("```"):
-                parts = cleaned.split("```")
-                cleaned = parts[1] if len(parts) > 1 else parts[0]
-                if cleaned.startswith("json"):
-                    cleaned = cleaned[4:]
+            batch = await self._client.messages.batches.create(requests=requests)
+        except Exception as e:
+            logger.error("feature_batch_submit_failed", error=str(e))
+            raise ExternalServiceException("Claude", str(e))
+        
+        logger.info("feature_batch_submitted", batch_id=batch.id, queries=len(queries))
+        return batch.id
+    
+    async def get_feature_batch_results(self, batch_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Collect extracted features for a finished batch.
+        
+        Args:
+            batch_id: ID returned by submit_feature_batch
+        
+        Returns:
+            Dict of custom_id ("q0", "q1", ...) to features, or None while
+            the batch is still processing. Failed entries map to an empty dict.
+        """
+        try:
+            batch = await self._client.messages.batches.retrieve(batch_id)
+            if batch.processing_status != "ended":
+                return None
             
-            features = json.loads(cleaned.strip())
-            logger.info("features_extracted", query=query[:50], features=features)
-            return features
+            results: Dict[str, Dict[str, Any]] = {}
+            async for entry in await self._client.messages.batches.results(batch_id):
+                features: Dict[str, Any] = {}
+                if entry.result.type == "succeeded":
+                    features = _tool_input(entry.result.message.content)
+                else:
+                    logger.warning("feature_batch_entry_failed", custom_id=entry.custom_id, result=entry.result.type)
+                results[entry.custom_id] = features
             
-        except json.JSONDecodeError as e:
-            logger.warning("feature_extraction_failed", error=str(e), response=response[:100])
-            return {}
+        except Exception as e:
+            logger.error("feature_batch_results_failed", batch_id=batch_id, error=str(e))
+            raise ExternalServiceException("Claude", str(e))
+        
+        logger.info("feature_batch_collected", batch_id=batch_id, results=len(results))
+        return results
+    
+    @staticmethod
+    def _can_template(cars: List[Dict[str, Any]], features: Optional[Dict[str, Any]]) -> bool:
+        """True when the results are few and the top car is the brand asked for."""
+        if not cars or len(cars) > TEMPLATE_SUMMARY_MAX_RESULTS or not features:
+            return False
+        brand = features.get("brand")
+        if isinstance(brand, list):
+            brand = brand[0] if brand else None
+        return bool(brand) and str(cars[0].get("brand", "")).lower() == str(brand).lower()
+    
+    @staticmethod
+    def _template_summary(cars: List[Dict[str, Any]], query: str, total_count: int) -> str:
+        """Deterministic summary highlighting the top car."""
+        top = cars[0]
+        price = top.get("price")
+        template = _SUMMARY_TEMPLATES[zlib.crc32(query.encode()) % len(_SUMMARY_TEMPLATES)]
+        return template.format(
+            count=total_count,
+            cars="car" if total_count == 1 else "cars",
+            are="is" if total_count == 1 else "are",
+            car=f"{top.get('year')} {top.get('brand')} {top.get('model')}",
+            price=f" at ${price:,.0f}" if isinstance(price, (int, float)) and price else "",
+        )
     
     async def generate_search_summary(
         self,
         cars: List[Dict[str, Any]],
         query: str,
-        total_count: int
+        total_count: int,
+        features: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Generate friendly summary of search results.
         
+        Simple searches (few results, top car matches the requested brand)
+        are summarized from a template without calling Claude.
+        
         Args:
             cars: List of car data
             query: Original search query
             total_count: Total cars found
+            features: Features extracted from the query, if available
         
         Returns:
             Summary message for user
@@ -144,30 +393,83 @@ Rules:
         if not cars:
             return f"I couldn't find cars matching '{query}'. Try adjusting your search."
         
-        system_prompt = """Generate a brief, friendly summary of car search results.
-Keep it to 2-3 sentences. Highlight the top car. Be conversational and helpful."""
-
-        # Format top results
+        if self._can_template(cars, features):
+            logger.info("summary_templated", query=query[:50], cars=len(cars))
+            return self._template_summary(cars, query, total_count)
+        
+        messages = self._summary_messages(cars, query, total_count)
+        
+        try:
+            summary = await self.complete(messages, system_prompt=SEARCH_SUMMARY_PROMPT, max_tokens=150)
+            return summary.strip()
+        except Exception as e:
+            logger.warning("summary_generation_failed", error=str(e))
+            top = cars[0]
+            return f"Found {total_count} cars. Top pick: {top.get('year')} {top.get('brand')} {top.get('model')}."
+    
+    async def stream_search_summary(
+        self,
+        cars: List[Dict[str, Any]],
+        query: str,
+        total_count: int,
+        features: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the search summary as Claude generates it.
+        
+        Same output as generate_search_summary, but text is yielded as it
+        arrives so the first sentence can render before generation ends.
+        Empty, templated and failed summaries are yielded as one chunk.
+        """
+        if not cars or self._can_template(cars, features):
+            yield await self.generate_search_summary(cars, query, total_count, features=features)
+            return
+        
+        streamed = False
+        try:
+            async with self._client.messages.stream(
+                model=self._model,
+                max_tokens=150,
+                system=_system_blocks(SEARCH_SUMMARY_PROMPT),
+                messages=self._summary_messages(cars, query, total_count)
+            ) as stream:
+                async for text in stream.text_stream:
+                    streamed = True
+                    yield text
+                
+                self._log_usage("claude_stream_success", await stream.get_final_message())
+        except Exception as e:
+            logger.warning("summary_stream_failed", error=str(e))
+            if not streamed:
+                top = cars[0]
+                yield f"Found {total_count} cars. Top pick: {top.get('year')} {top.get('brand')} {top.get('model')}."
+    
+    @staticmethod
+    def _summary_messages(cars: List[Dict[str, Any]], query: str, total_count: int) -> List[Dict[str, str]]:
+        """Build the summary request listing the top 3 cars."""
         top_cars = []
         for i, car in enumerate(cars[:3]):
             price = car.get("price", 0)
-            price_str = f"${price:,}" if price else "Contact dealer"
+            price_str = f"${price:,.0f}" if price else "Contact dealer"
             top_cars.append(
                 f"{i+1}. {car.get('year')} {car.get('brand')} {car.get('model')} - {price_str}"
             )
         
-        messages = [{
+        return [{
             "role": "user",
             "content": f"Query: {query}\nFound {total_count} cars:\n" + "\n".join(top_cars)
         }]
-        
-        try:
-            summary = await self.complete(messages, system_prompt=system_prompt, max_tokens=150)
-            return summary.strip()
-        except Exception as e:
-            logger.warning("summary_generation_failed", error=str(e))
-            top = cars[0]
-            return f"Found {total_count} cars. Top pick: {top.get('year')} {top.get('brand')} {top.get('model')}."
+
+
+@lru_cache(maxsize=1)
+def get_claude_client() -> ClaudeClient:
+    """
+    Process-wide Claude client.
+    
+    Sharing one instance keeps a single HTTP connection pool to Anthropic
+    instead of one per request.
+    """
+    return ClaudeClient()
 
 
 # Convenience alias
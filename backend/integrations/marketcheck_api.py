@@ -6,17 +6,96 @@ US-only marketplace.
 
 Documentation: https://docs.marketcheck.com/docs/get-started/api
 """
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
 from urllib.parse import quote_plus
+import asyncio
+import re
 
 import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential
+from cachetools import TTLCache
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # orjson is an optional speedup
+    from json import loads as _json_loads
 
 from core.config import settings
 from core.logging import get_logger
 
 logger = get_logger(__name__)
 
+# The filtering logger drops debug events, but only after the call's kwargs
+# are built; per-listing debug logs check this first instead.
+_DEBUG_ENABLED = settings.log_level.upper() == "DEBUG"
+
+# Converted listings per distinct API request. Identical searches (re-runs,
+# refreshes) within the TTL skip the network round trip entirely.
+_listings_cache: TTLCache = TTLCache(maxsize=1024, ttl=settings.marketcheck_cache_ttl_seconds)
+
+# One pooled client per process so searches reuse warm TCP/TLS connections
+# instead of handshaking with MarketCheck on every call.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared MarketCheck HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(settings.api_request_timeout_seconds), connect=5.0),
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+                keepalive_expiry=60,
+            ),
+            http2=True,
+        )
+    return _http_client
+
+
+async def warm_up_http_client(connections: int = 2) -> None:
+    """
+    Open keepalive connections to MarketCheck ahead of the first search.
+    
+    Any HTTP response (even 4xx for an unauthenticated HEAD) leaves a warm
+    TLS connection in the pool; failures are logged and ignored.
+    """
+    if not settings.marketcheck_api_key:
+        return
+    
+    client = get_http_client()
+    results = await asyncio.gather(
+        *(client.head(MarketCheckAPI.BASE_URL) for _ in range(connections)),
+        return_exceptions=True
+    )
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        logger.warning("marketcheck_warm_up_failed", error=str(failed[0]) or type(failed[0]).__name__)
+
+
+async def close_http_client() -> None:
+    """Close the shared client. Called on application shutdown."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Everything but digits and the decimal point in a price string ("$12,500.00")
+_PRICE_JUNK_RE = re.compile(r"[^\d.]")
+
+# Listing URL fields in priority order (MarketCheck uses both snake_case and
+# camelCase): vehicle detail page, dealer inventory, dealer website, listing.
+_SOURCE_URL_FIELDS = (
+    "vdp_url", "vdpUrl",
+    "inventory_url", "inventoryUrl",
+    "dealer_url", "dealerUrl",
+    "dealer_website", "dealerWebsite",
+    "listing_url", "listingUrl",
+    "url",
+)
+
 
 class MarketCheckAPI:
     """
@@ -27,6 +106,7 @@ class MarketCheckAPI:
     """
     
     BASE_URL = "https://api.marketcheck.com/v2/search/car/active"
+    MAX_IMAGES = 8  # Per listing
     
     def __init__(self):
         """Initialize the MarketCheck API client."""
@@ -38,11 +118,6 @@ class MarketCheckAPI:
             self.enabled = True
             logger.info("marketcheck_client_ready")
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        reraise=False
-    )
     async def search_listings(self, query_params: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
         Search real dealer listings using MarketCheck API.
@@ -62,26 +137,43 @@ class MarketCheckAPI:
         try:
             params = self._build_api_params(query_params)
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    self.BASE_URL,
-                    params=params
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                # MarketCheck API returns listings in different formats
-                listings = data.get("listings", []) or data.get("results", []) or []
-                
-                logger.info("marketcheck_search_success", listings_found=len(listings))
-                
-                cars = self._convert_listings_to_car_format(listings, query_params)
-                return cars
-                
+            # Keyed on the outgoing API params, so query fields the API
+            # ignores don't split the cache
+            cache_key = tuple(sorted(params.items()))
+            cached = _listings_cache.get(cache_key)
+            if cached is not None:
+                logger.info("marketcheck_cache_hit", listings=len(cached))
+                return [dict(car) for car in cached]
+            
+            response = await self._get_with_retry(params)
+            response.raise_for_status()
+            logger.debug("marketcheck_http_version", http_version=response.http_version)
+            
+            data = _json_loads(response.content)
+            # MarketCheck API returns listings in different formats
+            listings = data.get("listings", []) or data.get("results", []) or []
+            
+            logger.info("marketcheck_search_success", listings_found=len(listings))
+            
+            cars = self._convert_listings_to_car_format(listings, query_params)
+            if cars:
+                _listings_cache[cache_key] = cars
+            return [dict(car) for car in cars]
+            
         except Exception as e:
             logger.error("marketcheck_search_failed", error=str(e), exc_info=True)
             return []
     
+    async def _get_with_retry(self, params: Dict[str, Any], delay: float = 1.0) -> httpx.Response:
+        """GET the listings endpoint, retrying once on connection-level failures."""
+        client = get_http_client()
+        try:
+            return await client.get(self.BASE_URL, params=params)
+        except httpx.TransportError as e:
+            logger.warning("marketcheck_retrying", error=str(e) or type(e).__name__)
+            await asyncio.sleep(delay)
+            return await client.get(self.BASE_URL, params=params)
+    
     def _build_api_params(self, query_params: Dict[str, Any]) -> Dict[str, Any]:
         """
         Build MarketCheck API request parameters.
@@ -260,169 +352,188 @@ class MarketCheckAPI:
     def _convert_listings_to_car_format(self, listings: List[Dict], query_params: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Convert MarketCheck listings to our car format. US-only."""
         cars = []
-        
+        append = cars.append
+        convert_one = self._convert_one
         for listing in listings:
-            try:
-                vin = listing.get("vin", "")
-                raw_price = listing.get("price", 0)
-                
-                # Handle price
-                if isinstance(raw_price, str):
-                    try:
-                        raw_price = int(raw_price.replace("$", "").replace(",", "").strip())
-                    except (ValueError, TypeError):
-                        logger.warning("marketcheck_invalid_price", price=raw_price, vin=vin)
-                        continue
-                elif not isinstance(raw_price, (int, float)):
-                    logger.warning("marketcheck_unexpected_price_type", price=raw_price, vin=vin)
-                    continue
-                
-                if not raw_price or raw_price <= 0:
-                    continue
-                
-                # Build info is nested under 'build' object
-                build = listing.get("build", {}) or {}
-                year = build.get("year") or listing.get("year", 2023)
-                make = build.get("make") or listing.get("make", "Unknown")
-                model = build.get("model") or listing.get("model", "Car")
-                trim = build.get("trim") or listing.get("trim", "")
-                body_type = build.get("body_type") or listing.get("body_type", "")
-                transmission = build.get("transmission") or listing.get("transmission", "")
-                engine = build.get("engine") or listing.get("engine", "")
-                fuel_type = build.get("fuel_type") or listing.get("fuel_type", "")
-                drivetrain = build.get("drivetrain") or listing.get("drivetrain", "")
-                
-                mileage = listing.get("miles", 0) or listing.get("mileage", 0)
-                
-                # Get images from MarketCheck - nested under 'media'
-                images = []
-                media = listing.get("media", {})
-                if isinstance(media, dict):
-                    photo_list = media.get("photo_links", []) or media.get("photos", [])
-                    if isinstance(photo_list, list):
-                        images = [img for img in photo_list if isinstance(img, str) and img]
-                
-                # Filter out invalid URLs (SVGs, etc.)
-                if images:
-                    images = [
-                        img for img in images 
-                        if img and isinstance(img, str) and not img.lower().endswith('.svg')
-                    ]
-                
-                # Dealer info is nested under 'dealer' object
-                dealer = listing.get("dealer", {}) or {}
-                dealer_name = dealer.get("name") or listing.get("dealer_name", "Auto Dealer")
-                dealer_city = dealer.get("city") or listing.get("city", "")
-                dealer_state = dealer.get("state") or listing.get("state", "")
-                dealer_phone = dealer.get("phone") or listing.get("dealer_phone", "")
-                dealer_street = dealer.get("street") or listing.get("dealer_address", "")
-                dealer_zip = dealer.get("zip") or ""
-                dealer_address = f"{dealer_street}, {dealer_city}, {dealer_state} {dealer_zip}".strip(", ")
-                
-                full_location = f"{dealer_city}, {dealer_state}" if dealer_city else dealer_state or "Unknown Location"
-                
-                # Extract features from listing and build data
-                features = []
-                exterior_color = listing.get("exterior_color") or listing.get("base_ext_color")
-                interior_color = listing.get("interior_color") or listing.get("base_int_color")
-                
-                if exterior_color:
-                    features.append(f"{exterior_color} Exterior")
-                if interior_color:
-                    features.append(f"{interior_color} Interior")
-                if body_type:
-                    features.append(body_type.title())
-                if transmission:
-                    features.append(transmission)
-                if drivetrain:
-                    features.append(drivetrain)
-                if engine:
-                    features.append(engine)
-                
-                # Build description
-                description = f"{year} {make} {model}"
-                if trim:
-                    description += f" {trim}"
-                if body_type:
-                    description += f" - {body_type}"
-                
-                # Get dealer listing URL - prioritize actual dealer URLs from MarketCheck
-                # MarketCheck provides direct links to dealer listings
-                # Check both snake_case and camelCase field names
-                source_url = (
-                    listing.get("vdp_url") or listing.get("vdpUrl") or  # Vehicle Detail Page - direct link to specific car listing
-                    listing.get("inventory_url") or listing.get("inventoryUrl") or  # Dealer inventory page
-                    listing.get("dealer_url") or listing.get("dealerUrl") or  # Dealer website
-                    listing.get("dealer_website") or listing.get("dealerWebsite") or  # Alternative dealer website field
-                    listing.get("listing_url") or listing.get("listingUrl") or  # Listing URL
-                    listing.get("url") or  # Generic URL field
-                    None
-                )
-                
-                # Validate URL - ensure it's a proper HTTP/HTTPS URL
-                if source_url and isinstance(source_url, str):
-                    source_url = source_url.strip()
-                    if not (source_url.startswith("http://") or source_url.startswith("https://")):
-                        source_url = None
-                
-                # Fall back to Google search only if no valid dealer URL is available
-                if not source_url:
-                    search_parts = [str(year), make, model, dealer_name]
-                    if dealer_city:
-                        search_parts.append(dealer_city)
-                    if dealer_state:
-                        search_parts.append(dealer_state)
-                    search_query = " ".join(filter(None, search_parts))
-                    source_url = f"https://www.google.com/search?q={quote_plus(search_query)}"
-                    logger.debug("marketcheck_using_google_fallback", vin=vin, dealer=dealer_name)
-                else:
-                    logger.debug("marketcheck_using_dealer_url", vin=vin, url=source_url[:100] if len(source_url) > 100 else source_url)
-                
-                converted_price = raw_price
-                
-                logger.debug(
-                    "marketcheck_listing_parsed",
-                    make=make,
-                    model=model,
-                    year=year,
-                    price=converted_price
-                )
-                
-                # MPG from build object
-                highway_mpg = build.get("highway_mpg")
-                city_mpg = build.get("city_mpg")
-                mpg_str = None
-                if highway_mpg and city_mpg:
-                    mpg_str = f"{city_mpg}/{highway_mpg} mpg"
-                elif highway_mpg:
-                    mpg_str = f"{highway_mpg} mpg hwy"
-                
-                car = {
-                    "brand": make,
-                    "model": model,
-                    "year": year,
-                    "price": converted_price,
-                    "mileage": mileage,
-                    "location": full_location,
-                    "dealer_name": dealer_name,
-                    "dealer_phone": dealer_phone,
-                    "dealer_address": dealer_address,
-                    "source": "MarketCheck",
-                    "sourceUrl": source_url,
-                    "description": description,
-                    "features": features if features else ["Well Maintained"],
-                    "images": images[:8] if images else [],
-                    "vin": vin,
-                    "fuel_type": fuel_type,
-                    "transmission": transmission,
-                    "drivetrain": drivetrain,
-                    "power": build.get("horsepower") or engine,
-                    "mpg": mpg_str,
-                }
-                cars.append(car)
-                
-            except Exception as e:
-                logger.warning("marketcheck_listing_conversion_failed", error=str(e))
+            if not isinstance(listing, dict):
                 continue
-        
+            car = convert_one(listing)
+            if car is not None:
+                append(car)
         return cars
+    
+    def _convert_one(self, listing: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Convert a single listing, or return None if it has no usable price.
+        
+        Every field read is type-guarded, so malformed dealer data degrades
+        to defaults instead of raising.
+        """
+        get = listing.get  # Bound once for the many field lookups below
+        
+        # Price gates everything else, so check it before any other work
+        vin = get("vin", "")
+        raw_price = get("price", 0)
+        
+        # Handle price
+        if isinstance(raw_price, str):
+            try:
+                digits = _PRICE_JUNK_RE.sub("", raw_price)
+                raw_price = int(float(digits)) if digits else 0
+            except ValueError:
+                logger.warning("marketcheck_invalid_price", price=raw_price, vin=vin)
+                return None
+        elif not isinstance(raw_price, (int, float)):
+            logger.warning("marketcheck_unexpected_price_type", price=raw_price, vin=vin)
+            return None
+        
+        if not raw_price or raw_price <= 0:
+            return None
+        
+        # Build info is nested under 'build' object
+        build = get("build")
+        if not isinstance(build, dict):
+            build = {}
+        year = build.get("year") or get("year", 2023)
+        make = build.get("make") or get("make", "Unknown")
+        model = build.get("model") or get("model", "Car")
+        trim = build.get("trim") or get("trim", "")
+        body_type = build.get("body_type") or get("body_type", "")
+        transmission = build.get("transmission") or get("transmission", "")
+        engine = build.get("engine") or get("engine", "")
+        fuel_type = build.get("fuel_type") or get("fuel_type", "")
+        drivetrain = build.get("drivetrain") or get("drivetrain", "")
+        
+        mileage = get("miles", 0) or get("mileage", 0)
+        
+        # Get images from MarketCheck - nested under 'media'.
+        # Invalid entries (non-strings, empty, SVGs) and repeated URLs are
+        # dropped in one pass that stops at MAX_IMAGES, so long photo lists
+        # aren't copied. The dict keeps first-seen order.
+        images = []
+        media = get("media", {})
+        if isinstance(media, dict):
+            photo_list = media.get("photo_links", []) or media.get("photos", [])
+            if isinstance(photo_list, list):
+                unique = {}
+                for img in photo_list:
+                    if isinstance(img, str) and img and img[-4:].lower() != ".svg":
+                        unique[img] = None
+                        if len(unique) == self.MAX_IMAGES:
+                            break
+                images = list(unique)
+        
+        # Dealer info is nested under 'dealer' object (checked once;
+        # a non-dict value would otherwise fail every lookup below)
+        dealer = get("dealer")
+        if not isinstance(dealer, dict):
+            dealer = {}
+        dealer_name = dealer.get("name") or get("dealer_name", "Auto Dealer")
+        dealer_city = dealer.get("city") or get("city", "")
+        dealer_state = dealer.get("state") or get("state", "")
+        dealer_phone = dealer.get("phone") or get("dealer_phone", "")
+        dealer_street = dealer.get("street") or get("dealer_address", "")
+        dealer_zip = dealer.get("zip") or ""
+        dealer_address = f"{dealer_street}, {dealer_city}, {dealer_state} {dealer_zip}".strip(", ")
+        
+        full_location = f"{dealer_city}, {dealer_state}" if dealer_city else dealer_state or "Unknown Location"
+        
+        # Extract features from listing and build data
+        features = []
+        exterior_color = get("exterior_color") or get("base_ext_color")
+        interior_color = get("interior_color") or get("base_int_color")
+        
+        if exterior_color:
+            features.append(f"{exterior_color} Exterior")
+        if interior_color:
+            features.append(f"{interior_color} Interior")
+        if body_type:
+            features.append(str(body_type).title())
+        if transmission:
+            features.append(transmission)
+        if drivetrain:
+            features.append(drivetrain)
+        if engine:
+            features.append(engine)
+        
+        # Build description
+        description = f"{year} {make} {model}"
+        if trim:
+            description += f" {trim}"
+        if body_type:
+            description += f" - {body_type}"
+        
+        # Get dealer listing URL - prioritize actual dealer URLs from MarketCheck,
+        # most specific first, and accept only proper HTTP/HTTPS URLs
+        source_url = next(
+            (listing[field] for field in _SOURCE_URL_FIELDS if get(field)),
+            None
+        )
+        if isinstance(source_url, str):
+            source_url = source_url.strip()
+            if not source_url.startswith(("http://", "https://")):
+                source_url = None
+        else:
+            source_url = None
+        
+        # Fall back to Google search only if no valid dealer URL is available
+        used_fallback_url = not source_url
+        if used_fallback_url:
+            search_query = " ".join([
+                str(part) for part in (year, make, model, dealer_name, dealer_city, dealer_state)
+                if part
+            ])
+            source_url = f"https://www.google.com/search?q={quote_plus(search_query)}"
+        
+        if _DEBUG_ENABLED:
+            logger.debug(
+                "marketcheck_listing_parsed",
+                vin=vin,
+                make=make,
+                model=model,
+                year=year,
+                price=raw_price,
+                google_fallback_url=used_fallback_url
+            )
+        
+        # MPG from build object
+        highway_mpg = build.get("highway_mpg")
+        city_mpg = build.get("city_mpg")
+        mpg_str = None
+        if highway_mpg and city_mpg:
+            mpg_str = f"{city_mpg}/{highway_mpg} mpg"
+        elif highway_mpg:
+            mpg_str = f"{highway_mpg} mpg hwy"
+        
+        return {
+            "brand": make,
+            "model": model,
+            "year": year,
+            "price": raw_price,
+            "mileage": mileage,
+            "location": full_location,
+            "dealer_name": dealer_name,
+            "dealer_phone": dealer_phone,
+            "dealer_address": dealer_address,
+            "source": "MarketCheck",
+            "sourceUrl": source_url,
+            "description": description,
+            "features": features if features else ["Well Maintained"],
+            "images": images,
+            "vin": vin,
+            "fuel_type": fuel_type,
+            "transmission": transmission,
+            "drivetrain": drivetrain,
+            "power": build.get("horsepower") or engine,
+            "mpg": mpg_str,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_marketcheck_api() -> MarketCheckAPI:
+    """
+    Process-wide MarketCheck client.
+    
+    The API key is read from settings once, not on every search.
+    """
+    return MarketCheckAPI()
@@ -0,0 +1,191 @@
+"""
+Semantic cache for Claude feature extraction.
+
+Paraphrased queries ("SUV under 30k in LA" vs "sport utility near Los
+Angeles") produce the same extracted features, so results are cached by
+query embedding and served when cosine similarity clears a threshold.
+"""
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+import asyncio
+import re
+import time
+
+from cachetools import TTLCache
+
+from core.config import settings
+from core.logging import get_logger
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = get_logger(__name__)
+
+# Prices, mileages and years must be extracted exactly; a near neighbour
+# with a different number would return the wrong filter.
+_NUMERIC_LITERAL = re.compile(r"\d")
+
+# Colours, body styles, fuel types and makes become search filters, but
+# embeddings barely separate queries that differ only in one of them ("red
+# SUV" vs "blue SUV"). Entries are reused only when these terms match
+# exactly; synonyms map to one canonical term.
+_ATTRIBUTE_TERMS = {
+    **{color: color for color in (
+        "red", "blue", "black", "white", "silver", "gray", "green", "yellow",
+        "orange", "brown", "beige", "gold", "purple", "maroon",
+    )},
+    "grey": "gray",
+    **{body: body for body in (
+        "suv", "sedan", "truck", "coupe", "convertible", "hatchback", "wagon",
+        "van", "minivan", "crossover",
+    )},
+    "pickup": "truck",
+    **{fuel: fuel for fuel in ("electric", "hybrid", "diesel", "gas")},
+    "ev": "electric", "gasoline": "gas",
+    **{make: make for make in (
+        "toyota", "honda", "ford", "chevrolet", "nissan", "bmw", "mercedes",
+        "audi", "volkswagen", "hyundai", "kia", "subaru", "mazda", "lexus",
+        "jeep", "tesla", "dodge", "ram", "gmc", "porsche", "volvo", "acura",
+        "infiniti", "cadillac", "buick", "lincoln", "mitsubishi", "genesis",
+        "jaguar", "chrysler", "mini", "fiat", "alfa", "rover",
+    )},
+    "chevy": "chevrolet", "vw": "volkswagen", "benz": "mercedes",
+}
+_WORD = re.compile(r"[a-z]+")
+
+
+def _attribute_signature(query: str) -> frozenset:
+    """Canonical attribute terms in a query."""
+    return frozenset(
+        _ATTRIBUTE_TERMS[word] for word in _WORD.findall(query.lower())
+        if word in _ATTRIBUTE_TERMS
+    )
+
+
+class _Namespace:
+    """Cached embeddings and features for one user."""
+    
+    __slots__ = ("vectors", "features", "signatures", "stored_at")
+    
+    def __init__(self, dimensions: int):
+        import numpy as np
+        
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.features: List[Dict[str, Any]] = []
+        self.signatures: List[frozenset] = []
+        self.stored_at: List[float] = []
+
+
+class SemanticCache:
+    """
+    In-process nearest-neighbour cache keyed by query embedding.
+    
+    Entries are namespaced per user and expire after ttl_seconds. Lookups
+    are a single matrix-vector product over the namespace's entries, and
+    only entries with the same attribute terms as the query can match.
+    
+    Each lookup costs one OpenAI embedding call, capped at
+    embed_timeout_seconds (a slow embedding counts as a miss). Callers run
+    the lookup alongside the Claude call rather than before it, so a miss
+    adds no latency.
+    """
+    
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl_seconds: int = 3600,
+        max_entries_per_namespace: int = 64,
+        max_namespaces: int = 10_000,
+        embed_timeout_seconds: float = 0.5,
+    ):
+        # numpy and openai are imported only when the cache is enabled, so
+        # workers without an OpenAI key don't pay for them at boot
+        self.enabled = bool(settings.openai_api_key)
+        self._client = None
+        if self.enabled:
+            from openai import AsyncOpenAI
+            
+            self._client = AsyncOpenAI(api_key=settings.openai_api_key)
+        self._model = settings.openai_embedding_model
+        self._threshold = threshold
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries_per_namespace
+        self._embed_timeout = embed_timeout_seconds
+        self._namespaces: TTLCache = TTLCache(maxsize=max_namespaces, ttl=ttl_seconds)
+    
+    @staticmethod
+    def is_cacheable(query: str) -> bool:
+        """Queries with numeric literals bypass the cache."""
+        return not _NUMERIC_LITERAL.search(query)
+    
+    async def embed(self, query: str) -> "np.ndarray":
+        """Embed a query as a unit-length float32 vector."""
+        import numpy as np
+        
+        response = await self._client.embeddings.create(model=self._model, input=query)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+    
+    async def lookup(self, query: str, namespace: str) -> Tuple[Optional[Dict[str, Any]], Optional["np.ndarray"]]:
+        """
+        Find cached features for a semantically equivalent query.
+        
+        Args:
+            query: User's search query
+            namespace: Cache partition (usually the user ID)
+        
+        Returns:
+            Tuple of (features or None, query embedding). The embedding is
+            returned so a miss can be stored without embedding twice; it is
+            None when the query is not cacheable or embedding failed.
+        """
+        if not self.enabled or not self.is_cacheable(query):
+            return None, None
+        
+        try:
+            vector = await asyncio.wait_for(self.embed(query), timeout=self._embed_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("semantic_cache_embed_timeout", timeout=self._embed_timeout)
+            return None, None
+        except Exception as e:
+            logger.warning("semantic_cache_embed_failed", error=str(e))
+            return None, None
+        
+        entries = self._namespaces.get(namespace)
+        if entries is None or not entries.features:
+            return None, vector
+        
+        signature = _attribute_signature(query)
+        scores = entries.vectors @ vector
+        for i, entry_signature in enumerate(entries.signatures):
+            if entry_signature != signature:
+                scores[i] = -1.0
+        best = int(scores.argmax())
+        if scores[best] < self._threshold or time.monotonic() - entries.stored_at[best] > self._ttl:
+            return None, vector
+        
+        logger.info("semantic_cache_hit", namespace=namespace, similarity=round(float(scores[best]), 3))
+        return entries.features[best], vector
+    
+    def store(self, query: str, vector: "np.ndarray", namespace: str, features: Dict[str, Any]) -> None:
+        """Cache features for a query under its embedding from lookup()."""
+        import numpy as np
+        
+        entries = self._namespaces.get(namespace)
+        if entries is None:
+            entries = _Namespace(vector.shape[0])
+        
+        entries.vectors = np.vstack([entries.vectors, vector])[-self._max_entries:]
+        entries.features = (entries.features + [features])[-self._max_entries:]
+        entries.signatures = (entries.signatures + [_attribute_signature(query)])[-self._max_entries:]
+        entries.stored_at = (entries.stored_at + [time.monotonic()])[-self._max_entries:]
+        
+        # Re-insert to refresh the namespace TTL
+        self._namespaces[namespace] = entries
+
+
+# Process-wide instance, shared by the get_claude_client() singleton.
+semantic_cache = SemanticCache(
+    threshold=settings.semantic_cache_threshold,
+    ttl_seconds=settings.semantic_cache_ttl_seconds,
+    embed_timeout_seconds=settings.semantic_cache_embed_timeout_seconds,
+)
@@ -8,7 +8,7 @@ from sqlalchemy.orm import Session
 
 from db.models import Conversation, ConversationMessage, User
 from db.repositories import ConversationRepository, SearchRepository
-from integrations.anthropic_client import ClaudeClient
+from integrations.anthropic_client import get_claude_client
 from core.logging import get_logger
 
 logger = get_logger(__name__)
@@ -24,7 +24,7 @@ class AssistantService:
         self._db = db
         self._conversation_repo = ConversationRepository(db)
         self._search_repo = SearchRepository(db)
-        self._claude = ClaudeClient()
+        self._claude = get_claude_client()
     
     def get_conversation(self, user_id: int) -> Tuple[Conversation, List[ConversationMessage]]:
         """Get conversation state efficiently."""
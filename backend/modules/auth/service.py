@@ -171,6 +171,7 @@ class AuthService:
     ) -> dict:
         """Update basic profile details."""
         user = self.user_repo.get_by_id(user_id)
+        self.user_repo.invalidate_cached_lookups(username=user.username, email=user.email)
         
         if username and username != user.username:
             existing_username = self.user_repo.get_by_username(username)
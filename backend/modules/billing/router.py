@@ -17,7 +17,6 @@ from .schemas import (
     ContactSalesRequest
 )
 from core.logging import get_logger
-from .webhooks import process_webhook
 from fastapi import Request
 import os
 
@@ -31,6 +30,8 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
     Stripe webhook endpoint for payment events.
     Handles subscription creation, updates, and payment success.
     """
+    from .webhooks import process_webhook
+    
     return await process_webhook(request, db)
 
 
@@ -7,23 +7,42 @@ from typing import Optional, List, Tuple
 from datetime import datetime
 
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
 
-from db.base import get_db
+from db.base import get_db, SessionLocal
 from db.models import User, Search, SearchResult, Car, Conversation, ConversationMessage
-from db.repositories import UserPreferenceRepository, SearchRepository
+from db.repositories import (
+    UserPreferenceRepository,
+    SearchRepository,
+    ConversationRepository,
+    FeatureBatchRepository,
+)
 from core.jwt_auth import get_current_user_jwt
 from core.config import settings
 from core.logging import get_logger
 from core.exceptions import AppException
-from modules.search.schemas import SearchRequest, SearchResponse, CarResponse
+from modules.search.schemas import (
+    SearchRequest,
+    SearchResponse,
+    CarResponse,
+    FeatureBatchRequest,
+    FeatureBatchResponse,
+)
 from agents.tools.search_tools import search_car_listings
-from integrations.anthropic_client import ClaudeClient
+from integrations.anthropic_client import get_claude_client
 from services.credits_service import CreditsService
 
 logger = get_logger(__name__)
 router = APIRouter(prefix="/api/search", tags=["search"])
 
+# Searches whose summary is being streamed in this process. Concurrent
+# fetches of the same search get a 409 instead of another Claude call;
+# entries expire in case a stream is abandoned before it finishes.
+_summaries_in_progress: TTLCache = TTLCache(maxsize=10_000, ttl=120)
+
 
 # =============================================================================
 # Helper Functions
@@ -32,8 +51,9 @@ router = APIRouter(prefix="/api/search", tags=["search"])
 async def execute_search(
     query: str,
     user_context: dict,
-    db: Session
-) -> Tuple[List[dict], str]:
+    db: Session,
+    summarize: bool = True
+) -> Tuple[List[dict], Optional[str], dict]:
     """
     Execute car search with feature extraction and summary.
     
@@ -41,14 +61,16 @@ async def execute_search(
         query: User's search query
         user_context: User info (location, preferences)
         db: Database session
+        summarize: Generate the summary inline (False when it will be streamed)
     
     Returns:
-        Tuple of (cars, summary)
+        Tuple of (cars, summary, extracted features); summary is None when
+        summarize is False
     """
-    claude = ClaudeClient()
+    claude = get_claude_client()
     
     # Extract features from natural language
-    features = await claude.extract_search_features(query)
+    features = await claude.extract_search_features(query, namespace=str(user_context.get("user_id")))
     logger.info("features_extracted", query=query[:50], features=features)
     
     # Build search parameters (handle list or string)
@@ -110,10 +132,13 @@ async def execute_search(
     
     logger.info("search_executed", cars_found=len(cars))
     
+    if not summarize:
+        return cars, None, features
+    
     # Generate summary
-    summary = await claude.generate_search_summary(cars, query, len(cars))
+    summary = await claude.generate_search_summary(cars, query, len(cars), features=features)
     
-    return cars, summary
+    return cars, summary, features
 
 
 def persist_search_results(
@@ -121,7 +146,8 @@ def persist_search_results(
     user_id: int,
     query: str,
     cars: List[dict],
-    summary: str
+    summary: Optional[str],
+    features: Optional[dict] = None
 ) -> int:
     """
     Save search results to database.
@@ -131,16 +157,22 @@ def persist_search_results(
         user_id: User's ID
         query: Search query
         cars: List of car data
-        summary: AI-generated summary
+        summary: AI-generated summary (None when streamed separately)
+        features: Extracted search features, kept for the streamed summary
     
     Returns:
         Search ID
     """
+    # The search and its user message share a timestamp, so a summary
+    # streamed later can be placed right after that message
+    now = datetime.utcnow()
+    
     # Create search record
     search = Search(
         user_id=user_id,
         query=query,
-        created_at=datetime.utcnow()
+        extracted_features=features,
+        created_at=now
     )
     db.add(search)
     db.flush()
@@ -197,16 +229,18 @@ def persist_search_results(
         conversation_id=conversation.id,
         role="user",
         content=query,
-        created_at=datetime.utcnow()
+        created_at=now
     ))
     
     # Add assistant's summary response
-    db.add(ConversationMessage(
-        conversation_id=conversation.id,
-        role="assistant",
-        content=summary,
-        created_at=datetime.utcnow()
-    ))
+    if summary is not None:
+        SearchRepository(db).add_summary(search.id, summary)
+        db.add(ConversationMessage(
+            conversation_id=conversation.id,
+            role="assistant",
+            content=summary,
+            created_at=datetime.utcnow()
+        ))
     
     db.commit()
     
@@ -214,6 +248,38 @@ def persist_search_results(
     return search.id
 
 
+def persist_streamed_summary(search_id: int, user_id: int, searched_at: datetime, summary: str) -> None:
+    """
+    Store a streamed summary and add it to the conversation.
+    
+    The assistant message is stamped with the time of that search's user
+    message, so it sorts directly after it (ids break the tie) even if
+    newer searches were made since. Runs after the response stream ends,
+    so it uses its own session rather than the request's.
+    """
+    db = SessionLocal()
+    try:
+        if not SearchRepository(db).add_summary(search_id, summary):
+            return
+        
+        conversation = ConversationRepository(db).get_or_create(user_id)
+        asked_at = db.query(ConversationMessage.created_at).filter(
+            ConversationMessage.conversation_id == conversation.id,
+            ConversationMessage.role == "user",
+            ConversationMessage.created_at >= searched_at
+        ).order_by(ConversationMessage.created_at).limit(1).scalar()
+        
+        db.add(ConversationMessage(
+            conversation_id=conversation.id,
+            role="assistant",
+            content=summary,
+            created_at=asked_at or searched_at
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
 def load_cars_from_search(db: Session, search_id: int) -> List[CarResponse]:
     """
     Load cars from a search result.
@@ -283,6 +349,26 @@ def load_latest_results_for_user(db: Session, user_id: int) -> Tuple[List[CarRes
     return cars, latest_search.id
 
 
+def charge_search_credit(db: Session, user_id: int) -> None:
+    """
+    Check the user's quota and deduct one search credit.
+    
+    Raises:
+        AppException: 402 when the user has no credits left
+    """
+    credits = CreditsService(db)
+    if not credits.check_quota(user_id):
+        logger.warning("quota_exceeded", user_id=user_id)
+        raise AppException("No credits remaining. Please upgrade.", 402)
+    
+    try:
+        credits.deduct_credit(user_id)
+        db.commit()
+    except AppException as e:
+        if e.status_code == 402:
+            raise
+
+
 def build_user_context(user_id: int, user: User, db: Session) -> dict:
     """
     Build user context for personalization.
@@ -351,38 +437,29 @@ async def search_cars(
     """
     user_id = int(current_user.id)
     
-    # Check credits
-    credits = CreditsService(db)
-    if not credits.check_quota(user_id):
-        logger.warning("quota_exceeded", user_id=user_id)
-        raise AppException("No credits remaining. Please upgrade.", 402)
+    # Check and deduct credits (sync DB work runs off the event loop)
+    await run_in_threadpool(charge_search_credit, db, user_id)
     
-    # Deduct credit
-    try:
-        credits.deduct_credit(user_id)
-        db.commit()
-    except AppException as e:
-        if e.status_code == 402:
-            raise
-    
-    user_context = build_user_context(user_id, current_user, db)
+    user_context = await run_in_threadpool(build_user_context, user_id, current_user, db)
     
     logger.info("search_request", query=request.query[:50], user_id=user_id)
     
     try:
         # Execute search with timeout
-        cars, summary = await asyncio.wait_for(
-            execute_search(request.query, user_context, db),
+        cars, summary, features = await asyncio.wait_for(
+            execute_search(request.query, user_context, db, summarize=not request.stream_summary),
             timeout=float(settings.search_timeout_seconds)
         )
         
-        # Persist results
+        # Persist results (sync DB work runs off the event loop)
         search_id = None
         if cars:
-            search_id = persist_search_results(db, user_id, request.query, cars, summary)
+            search_id = await run_in_threadpool(
+                persist_search_results, db, user_id, request.query, cars, summary, features
+            )
         
         # Load persisted cars
-        car_results = load_cars_from_search(db, search_id) if search_id else []
+        car_results = await run_in_threadpool(load_cars_from_search, db, search_id) if search_id else []
         
         logger.info("search_complete", query=request.query[:50], cars=len(car_results))
         
@@ -416,15 +493,15 @@ async def get_personalized_results(
     - Otherwise, searches based on user preferences
     """
     user_id = int(current_user.id)
-    user_context = build_user_context(user_id, current_user, db)
+    user_context = await run_in_threadpool(build_user_context, user_id, current_user, db)
     
     # Check for existing results first (for home page)
-    existing_cars, existing_search_id = load_latest_results_for_user(db, user_id)
+    existing_cars, existing_search_id = await run_in_threadpool(load_latest_results_for_user, db, user_id)
     
     if existing_cars:
         # Get the query from the existing search
         search_repo = SearchRepository(db)
-        last_searches = search_repo.get_user_history(user_id, limit=1)
+        last_searches = await run_in_threadpool(search_repo.get_user_history, user_id, 1)
         query = last_searches[0].query if last_searches else "Your recent search"
         
         logger.info("returning_cached_results", user_id=user_id, cars=len(existing_cars))
@@ -453,16 +530,16 @@ async def get_personalized_results(
     logger.info("personalized_search", user_id=user_id, query=query[:50])
     
     try:
-        cars, summary = await asyncio.wait_for(
+        cars, summary, features = await asyncio.wait_for(
             execute_search(query, user_context, db),
             timeout=float(settings.search_timeout_seconds)
         )
         
         search_id = None
         if cars:
-            search_id = persist_search_results(db, user_id, query, cars, summary)
+            search_id = await run_in_threadpool(persist_search_results, db, user_id, query, cars, summary, features)
         
-        car_results = load_cars_from_search(db, search_id) if search_id else []
+        car_results = await run_in_threadpool(load_cars_from_search, db, search_id) if search_id else []
         
         return SearchResponse(
             success=True,
@@ -492,7 +569,7 @@ async def get_latest_results(
     """
     user_id = int(current_user.id)
     
-    cars, search_id = load_latest_results_for_user(db, user_id)
+    cars, search_id = await run_in_threadpool(load_latest_results_for_user, db, user_id)
     
     if not cars:
         return SearchResponse(
@@ -506,7 +583,7 @@ async def get_latest_results(
     
     # Get the query
     search_repo = SearchRepository(db)
-    last_searches = search_repo.get_user_history(user_id, limit=1)
+    last_searches = await run_in_threadpool(search_repo.get_user_history, user_id, 1)
     query = last_searches[0].query if last_searches else ""
     
     return SearchResponse(
@@ -517,3 +594,116 @@ async def get_latest_results(
         search_id=search_id,
         message=f"Your latest search: '{query}'"
     )
+
+
+@router.post("/features/batch", response_model=FeatureBatchResponse)
+async def submit_feature_batch(
+    request: FeatureBatchRequest,
+    current_user: User = Depends(get_current_user_jwt),
+    db: Session = Depends(get_db)
+):
+    """
+    Submit queries for background feature extraction.
+    
+    Uses the Message Batches API (half price, results within 24h).
+    Each query costs one search credit. Poll GET /features/batch/{batch_id}
+    for results.
+    """
+    user_id = int(current_user.id)
+    query_count = len(request.queries)
+    
+    credits = CreditsService(db)
+    await run_in_threadpool(credits.deduct_credit, user_id, query_count)
+    
+    claude = get_claude_client()
+    try:
+        batch_id = await claude.submit_feature_batch(request.queries)
+    except Exception:
+        # Nothing was submitted, so give the credits back
+        if not current_user.unlimited_searches:
+            await run_in_threadpool(credits.add_credits, user_id, query_count)
+        raise
+    
+    await run_in_threadpool(FeatureBatchRepository(db).create, batch_id, user_id, query_count)
+    
+    logger.info("feature_batch_requested", user_id=user_id, queries=query_count)
+    
+    return FeatureBatchResponse(batch_id=batch_id, status="processing")
+
+
+@router.get("/features/batch/{batch_id}", response_model=FeatureBatchResponse)
+async def get_feature_batch(
+    batch_id: str,
+    current_user: User = Depends(get_current_user_jwt),
+    db: Session = Depends(get_db)
+):
+    """Get extracted features for one of the user's batches once it has ended."""
+    # Raises 404 for unknown batches and for batches owned by other users
+    await run_in_threadpool(FeatureBatchRepository(db).get_for_user, batch_id, int(current_user.id))
+    
+    claude = get_claude_client()
+    features = await claude.get_feature_batch_results(batch_id)
+    
+    if features is None:
+        return FeatureBatchResponse(batch_id=batch_id, status="processing")
+    
+    return FeatureBatchResponse(batch_id=batch_id, status="ended", features=features)
+
+
+@router.get("/{search_id}/summary/stream")
+async def stream_search_summary(
+    search_id: int,
+    current_user: User = Depends(get_current_user_jwt),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream the AI summary for a search as plain text.
+    
+    Pairs with SearchRequest.stream_summary: the search returns results
+    immediately and the summary renders here token by token. The summary
+    is generated once per search (covered by the search's credit); later
+    fetches return the stored text.
+    """
+    search_repo = SearchRepository(db)
+    search = await run_in_threadpool(search_repo.get_by_id, search_id)
+    if search.user_id != current_user.id:
+        raise AppException("Search not found", 404)
+    
+    stored = await run_in_threadpool(search_repo.get_summary, search_id)
+    if stored is not None:
+        return StreamingResponse(iter([stored]), media_type="text/plain")
+    
+    if search_id in _summaries_in_progress:
+        raise AppException("Summary is already being generated", 409)
+    _summaries_in_progress[search_id] = True
+    
+    try:
+        car_results = await run_in_threadpool(load_cars_from_search, db, search_id)
+    except Exception:
+        _summaries_in_progress.pop(search_id, None)
+        raise
+    cars = [
+        {"year": c.year, "brand": c.brand, "model": c.model, "price": c.priceNumeric}
+        for c in car_results
+    ]
+    
+    user_id = int(current_user.id)
+    query = search.query
+    searched_at = search.created_at
+    features = search.extracted_features
+    claude = get_claude_client()
+    
+    async def stream_and_persist():
+        try:
+            parts = []
+            async for text in claude.stream_search_summary(cars, query, len(cars), features=features):
+                parts.append(text)
+                yield text
+            
+            summary = "".join(parts)
+            if summary:
+                await run_in_threadpool(persist_streamed_summary, search_id, user_id, searched_at, summary)
+        finally:
+            _summaries_in_progress.pop(search_id, None)
+    
+    return StreamingResponse(stream_and_persist(), media_type="text/plain")
@@ -9,6 +9,9 @@ class SearchRequest(BaseModel):
     """Request schema for car search."""
     query: str = Field(..., min_length=1)
     user_id: Optional[int] = None
+    # Skip the inline summary; fetch it from /{search_id}/summary/stream
+    # instead, which also saves it to the conversation once it completes
+    stream_summary: bool = False
 
 
 class SpecsResponse(BaseModel):
@@ -52,3 +55,16 @@ class SearchResponse(BaseModel):
     results: List[CarResponse]
     search_id: Optional[int] = None
     message: Optional[str] = None  # Agent's response text
+
+
+class FeatureBatchRequest(BaseModel):
+    """Request schema for submitting a feature-extraction batch."""
+    # Each query costs one search credit
+    queries: List[str] = Field(..., min_length=1, max_length=100)
+
+
+class FeatureBatchResponse(BaseModel):
+    """Response schema for a feature-extraction batch."""
+    batch_id: str
+    status: str  # "processing" or "ended"
+    features: Optional[Dict[str, Dict[str, Any]]] = None  # custom_id ("q0", ...) -> features
@@ -35,10 +35,12 @@ class CreditsService:
     
     def get_user_credits(self, user_id: int) -> Optional[dict]:
         """Get user's current credit status."""
-        user = self.db.query(User).filter(User.id == user_id).first()
+        # The authenticated user is normally already in the session's identity map
+        user = self.db.get(User, user_id)
         if not user:
             return None
         
+        # Plan is joined-loaded with the subscription (no extra lazy SELECT)
         subscription = self.db.query(UserSubscription).filter(
             UserSubscription.user_id == user_id
         ).first()
@@ -50,11 +52,11 @@ class CreditsService:
             "plan_name": subscription.plan.name if subscription else None
         }
     
-    def deduct_credit(self, user_id: int) -> bool:
+    def deduct_credit(self, user_id: int, amount: int = 1) -> bool:
         """
-        Atomically deduct one credit from user's balance.
+        Atomically deduct credits from user's balance (one per search by default).
         Uses SELECT FOR UPDATE to prevent race conditions.
-        Raises AppException if no credits remaining.
+        Raises AppException if the balance can't cover the amount.
         Returns True if successful.
         """
         from sqlalchemy import text
@@ -70,12 +72,12 @@ class CreditsService:
             return True
         
         # Check if user has credits (atomic check)
-        if user.credits_remaining <= 0:
-            logger.warning("no_credits_remaining", user_id=user_id)
+        if user.credits_remaining < amount:
+            logger.warning("no_credits_remaining", user_id=user_id, requested=amount)
             raise AppException("No credits remaining. Please upgrade your plan.", 402)
         
         # Deduct credit atomically
-        user.credits_remaining -= 1
+        user.credits_remaining -= amount
         self.db.commit()
         
         logger.info(